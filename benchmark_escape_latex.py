@@ -0,0 +1,125 @@
+"""
+Compare the single-pass `escape_latex` with the previous implementation, which used one regular
+expression per replacement, and check that both produce identical output.
+"""
+import argparse
+import json
+import random
+import re
+import time
+from pathlib import Path
+
+from lib.latex import escape_latex, _escape_latex_text
+
+
+LEGACY_LATEX_ESCAPE = [
+    (re.compile(r'\\'), r'\\textbackslash'),
+    (re.compile(r'([{}_#%&$])'), r'\\\1'),
+    (re.compile(r'~'), r'\~{}'),
+    (re.compile(r'\^'), r'\^{}'),
+    (re.compile(r'"'), r"''"),
+    (re.compile(r'\.\.\.+'), r'\\ldots'),
+    (re.compile(r'/'), r'\/')
+]
+
+SPECIAL_TEXTS = [
+    '', 'plain text', '\\', '\\\\', '{}', '\\{', 'a_b#c%d&e$f', '~^~^', '"quoted"', '.', '..', '...', '....',
+    '.....', 'a...b..c', '1/2', '\\/', '~/x/...', '^{...}', '$\\frac{1}{2}$', 'µm ÄÖÜ', '0.4 mm', '100%',
+]
+
+
+def legacy_escape_latex(value: str) -> str:
+    value = str(value)
+    for regexp, replacement in LEGACY_LATEX_ESCAPE:
+        value = regexp.sub(replacement, value)
+    return value
+
+
+def collect_values(project_dir: Path) -> list[str]:
+    """
+    Collect the texts and values from the parameter file of a project, as they appear in the tables.
+
+    :param project_dir: The project directory.
+    :return: A list with all texts.
+    """
+    path = project_dir / 'parameters.json'
+    if not path.is_file():
+        return []
+    data = json.loads(path.read_text(encoding='utf-8'))
+    values: list[str] = [data.get('component_name', '')]
+    for parameter in data.get('parameter', []):
+        values.extend(str(v) for v in parameter.values())
+    for model in data.get('models', []):
+        values.append(model.get('part_id', ''))
+        values.extend(str(v) for v in model.get('parameters', {}).values())
+    return values
+
+
+def random_texts(count: int, seed: int) -> list[str]:
+    """
+    Create random texts with a high share of special characters.
+    """
+    generator = random.Random(seed)
+    alphabet = 'ab1 .\\{}_#%&$~^"/'
+    return list([''.join(generator.choice(alphabet) for _ in range(generator.randrange(0, 24)))
+                 for _ in range(count)])
+
+
+def check_equivalence(values: list[str]) -> int:
+    """
+    Check that the new implementation produces the same output as the previous one.
+
+    :return: The number of mismatches.
+    """
+    mismatches = 0
+    for value in values:
+        expected = legacy_escape_latex(value)
+        actual = escape_latex(value)
+        if actual != expected:
+            mismatches += 1
+            print(f'MISMATCH for {value!r}: expected {expected!r}, got {actual!r}')
+    return mismatches
+
+
+def measure(function, values: list[str], repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for value in values:
+            function(value)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Compare the single-pass `escape_latex` with the previous implementation.')
+    parser.add_argument('project_dir',
+                        metavar='<project directory>',
+                        nargs='?',
+                        default=str(Path(__file__).parent / 'examples' / 'project'),
+                        help='Path to a project directory, whose values are used. Defaults to the example project.')
+    parser.add_argument('-r', '--repeat',
+                        metavar='N',
+                        type=int,
+                        default=20,
+                        help='The number of times every value is escaped.')
+    args = parser.parse_args()
+    values = collect_values(Path(args.project_dir))
+    mismatches = check_equivalence(SPECIAL_TEXTS + values + random_texts(20000, 2052))
+    if mismatches:
+        exit(f'{mismatches} values are escaped differently.')
+    print('The output of both implementations is identical.')
+    if not values:
+        values = SPECIAL_TEXTS
+    print(f'Escaping {len(values)} values {args.repeat} times.')
+    legacy_time = measure(legacy_escape_latex, values, args.repeat)
+    _escape_latex_text.cache_clear()
+    single_pass_time = measure(lambda v: _escape_latex_text.__wrapped__(str(v)), values, args.repeat)
+    _escape_latex_text.cache_clear()
+    cached_time = measure(escape_latex, values, args.repeat)
+    for name, elapsed in (('legacy', legacy_time), ('single-pass', single_pass_time), ('cached', cached_time)):
+        print(f'{name:>12}: {elapsed:8.3f} s, {elapsed / (len(values) * args.repeat) * 1e9:8.1f} ns/value')
+    exit(0)
+
+
+if __name__ == '__main__':
+    main()
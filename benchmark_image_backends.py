@@ -0,0 +1,91 @@
+"""
+Compare the image conversion backends on the images of a catalog project.
+"""
+import argparse
+import logging
+import tempfile
+import time
+from pathlib import Path
+
+from generate_project_catalog import CatalogWorkingSet
+from lib.exceptions import ScriptError
+from lib.images import (IMAGE_BACKENDS, DEFAULT_IMAGE_DPI, ImageCache, ImageConversion, ImageConverter,
+                        default_job_count, image_width_for_usage)
+
+
+def collect_images(project_dir: Path, log: logging.Logger) -> list[tuple[Path, str]]:
+    """
+    Collect all images that are embedded into the catalog of a project.
+
+    :param project_dir: The project directory.
+    :param log: The logger.
+    :return: A list with the paths of all images and their usage.
+    """
+    ws = CatalogWorkingSet()
+    ws.log = log
+    ws.project_dir = project_dir
+    ws.intermediate_path = project_dir / 'tmp'
+    ws.cache_path = project_dir / '.catalog-cache'
+    ws.scan_files()
+    ws.read_parameter_file()
+    ws.read_configuration()
+    ws.infer_schema()
+    ws.process_models()
+    images: dict[Path, str] = {}
+    for name, usage in ws.images_to_compress:
+        images.setdefault(ws.image_files[name], usage)
+    return list(images.items())
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Compare the image conversion backends on the images of a catalog project.')
+    parser.add_argument('project_dir',
+                        metavar='<project directory>',
+                        nargs='?',
+                        default=str(Path(__file__).parent / 'examples' / 'project'),
+                        help='Path to the project directory. Defaults to the example project.')
+    parser.add_argument('-j', '--jobs',
+                        metavar='N',
+                        type=int,
+                        default=default_job_count(),
+                        help='The maximum number of concurrent workers.')
+    parser.add_argument('-b', '--backend',
+                        choices=IMAGE_BACKENDS,
+                        action='append',
+                        help='A backend to benchmark. Can be repeated. Defaults to all backends.')
+    parser.add_argument('--image-dpi',
+                        metavar='DPI',
+                        type=int,
+                        default=DEFAULT_IMAGE_DPI,
+                        help='The resolution of the embedded images.')
+    args = parser.parse_args()
+    logging.basicConfig(encoding='utf-8', level=logging.WARNING)
+    log = logging.getLogger('main')
+    try:
+        images = collect_images(Path(args.project_dir), log)
+        if not images:
+            raise ScriptError('The project has no images to convert.')
+        print(f'Converting {len(images)} images with {args.jobs} jobs.')
+        for backend in args.backend or IMAGE_BACKENDS:
+            # Use an empty cache for every backend, so every image is actually converted.
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                output_dir = Path(tmp_dir) / 'output'
+                output_dir.mkdir()
+                converter = ImageConverter(ImageCache(Path(tmp_dir) / 'cache'), args.jobs, log, backend)
+                conversions = list([
+                    ImageConversion(p, output_dir / f'{i}.jpg', image_width_for_usage(usage, args.image_dpi))
+                    for i, (p, usage) in enumerate(images)])
+                start = time.perf_counter()
+                converter.convert(conversions)
+                elapsed = time.perf_counter() - start
+                size = sum(c.target_path.stat().st_size for c in conversions)
+            print(f'{backend:>10}: {elapsed:8.3f} s, {elapsed / len(images) * 1000:8.2f} ms/image, '
+                  f'{size / 1024:10.1f} KiB total')
+    except ScriptError as err:
+        exit(str(err))
+    exit(0)
+
+
+if __name__ == '__main__':
+    main()
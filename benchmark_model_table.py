@@ -0,0 +1,148 @@
+"""
+Compare the memory use and the sorting and grouping speed of the columnar `ModelTable` with
+the previous per-model dictionaries, and check that both produce the same order and groups.
+"""
+import argparse
+import gc
+import itertools
+import random
+import time
+import tracemalloc
+from operator import itemgetter
+from pathlib import Path
+
+from lib.model import Model, ModelTable
+
+
+PARAMETERS = ['width', 'depth', 'height', 'rim_height', 'wall_thickness', 'weight']
+
+
+def create_models(count: int, seed: int) -> list[Model]:
+    """
+    Create random models with a typical mix of integer and decimal values.
+    """
+    generator = random.Random(seed)
+    models = []
+    for index in range(count):
+        values = {
+            'width': str(generator.choice([52, 62, 82, 102, 122, 152])),
+            'depth': str(generator.choice([52, 62, 82, 102, 122, 152])),
+            'height': f'{generator.randrange(10, 200) / 10:.1f}',
+            'rim_height': str(generator.choice([7, 14, 21])),
+            'wall_thickness': f'{generator.choice([0.8, 1.2, 1.6])}',
+            'weight': str(generator.randrange(5, 400)),
+        }
+        part_id = f'MODEL-{index:06d}'
+        models.append(Model(part_id, [Path(f'{part_id}.3mf')], [Path(f'{part_id}.jpg')], values))
+    return models
+
+
+def convert(value: str):
+    return float(value) if '.' in value else int(value)
+
+
+def format_value(value) -> str:
+    return f'{value} mm'
+
+
+def process_legacy(models: list[Model]) -> list[Model]:
+    """
+    Process the models like the generator did before, with three dictionaries per model.
+    """
+    for model in models:
+        model.values = dict((name, convert(model.original_values[name])) for name in PARAMETERS)
+        model.formatted_values = dict((name, format_value(model.values[name])) for name in PARAMETERS)
+    return models
+
+
+def process_table(models: list[Model]) -> ModelTable:
+    table = ModelTable.from_models(models)
+    for name in PARAMETERS:
+        table.set_values(name, list([convert(v) for v in table.original_column(name)]))
+    for name in PARAMETERS:
+        table.set_formatted_values(name, table.map_column(name, format_value))
+    return table
+
+
+def measure_memory(function, count: int, seed: int) -> tuple[object, int]:
+    """
+    Measure the memory of the result of a function, including the models it was created from.
+    """
+    gc.collect()
+    tracemalloc.start()
+    result = function(create_models(count, seed))
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, size
+
+
+def group_legacy(models: list[Model], order: list[str], group: list[str]) -> tuple[dict, dict]:
+    """
+    Sort and group the models like the generator did before, by filtering all models for every group.
+    """
+    sorted_models = sorted(models, key=lambda x: itemgetter(*order)(x.values))
+    value_sets = dict((name, sorted(set(m.values[name] for m in models))) for name in order)
+    groups = {}
+    for combination in itertools.product(*(value_sets[name] for name in group)):
+        groups[combination] = list([m.part_id for m in sorted_models
+                                    if all(m.values[n] == v for n, v in zip(group, combination))])
+    tables = {}
+    for name in order:
+        for value in value_sets[name]:
+            tables[(name, value)] = list([list([m.part_id] + [m.formatted_values[c] for c in order if c != name])
+                                          for m in sorted_models if m.values[name] == value])
+    return groups, tables
+
+
+def group_table(table: ModelTable, order: list[str], group: list[str]) -> tuple[dict, dict]:
+    """
+    Sort and group the models like the generator does now, with a single pass for all groups.
+    """
+    sorted_table = table.take(table.sorted_indexes(order))
+    value_sets = dict((name, sorted(set(table.column(name)))) for name in order)
+    indexes = sorted_table.group_indexes(group)
+    groups = {}
+    for combination in itertools.product(*(value_sets[name] for name in group)):
+        groups[combination] = list(sorted_table.take(indexes.get(combination, [])).part_ids)
+    tables = {}
+    for name in order:
+        indexes = sorted_table.group_indexes([name])
+        columns = list([sorted_table.part_ids] + [sorted_table.formatted_values[c] for c in order if c != name])
+        for value in value_sets[name]:
+            tables[(name, value)] = list([list([c[i] for c in columns]) for i in indexes.get((value,), [])])
+    return groups, tables
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Compare the columnar model table with the previous per-model dictionaries.')
+    parser.add_argument('-n', '--count',
+                        metavar='N',
+                        type=int,
+                        default=100000,
+                        help='The number of models.')
+    args = parser.parse_args()
+    order = ['width', 'depth', 'height', 'rim_height']
+    group = ['width', 'depth']
+    # The models themselves are part of the result for the previous implementation, so the original
+    # values of both implementations are measured.
+    legacy, legacy_size = measure_memory(process_legacy, args.count, 2052)
+    table, table_size = measure_memory(process_table, args.count, 2052)
+    if group_legacy(legacy, order, group) != group_table(table, order, group):
+        exit('The order or the groups of both implementations differ.')
+    for model, row in zip(legacy, table):
+        if model.values != dict(row.values) or model.formatted_values != dict(row.formatted_values):
+            exit(f'The values of {model.part_id} differ.')
+    print('The values, order and groups of both implementations are identical.')
+    print(f'Memory for {args.count} models: dictionaries {legacy_size / 1e6:.1f} MB, '
+          f'table {table_size / 1e6:.1f} MB, {legacy_size / table_size:.1f}x less.')
+    for name, function, models in (('dictionaries', group_legacy, legacy), ('table', group_table, table)):
+        start = time.perf_counter()
+        function(models, order, group)
+        print(f'{name:>12}: sorting and grouping {time.perf_counter() - start:8.3f} s')
+    exit(0)
+
+
+if __name__ == '__main__':
+    main()
@@ -4,20 +4,41 @@ Generate a PDF catalog from a model file collection using LaTeX.
 """
 import argparse
 import configparser
+import functools
+import hashlib
 import itertools
 import json
 import logging
 import shutil
-import subprocess
 import tomllib
-from operator import itemgetter
+from decimal import Decimal
 from pathlib import Path
+from types import CodeType
 from typing import Optional, Union, Any, Literal
 from jinja2 import Environment, FileSystemLoader
 
-from lib.model import Model
+from lib.model import Model, ModelTable
+from lib.derived import DerivedEvaluator
 from lib.exceptions import ScriptError
-from lib.latex import escape_latex, write_latex_template, create_pdf_from_latex
+from lib.images import (DEFAULT_IMAGE_DPI, ImageCache, ImageConversion, ImageConverter, ImageStore,
+                        default_job_count, image_width_for_usage)
+from lib.latex import (LatexOptions, escape_latex, write_latex_template, create_pdf_from_latex,
+                       latex_format_for)
+from lib.manifest import BuildManifest, file_fingerprint
+from lib.options import add_build_arguments, apply_build_arguments
+from lib.schema import check_value_type, convert_values, infer_value_type
+from lib.stages import Stage, StageRunner
+
+
+@functools.lru_cache(maxsize=None)
+def compile_expression(expression: str) -> CodeType:
+    """
+    Compile an expression from the configuration, so it is parsed only once.
+
+    :param expression: The Python expression.
+    :return: The code object, to use with `eval`.
+    """
+    return compile(expression, '<expression>', 'eval')
 
 
 class Parameter:
@@ -25,24 +46,39 @@ class Parameter:
     A parameter that defines a model.
     """
 
-    def __init__(self, title: str, name: str, unit: str):
+    def __init__(self, title: str, name: str, unit: str, value_type: str = ''):
         """
         Create a new parameter.
 
         :param title: The title for the parameter used in the text.
         :param name: An internal name for parameter replacements.
         :param unit: The unit for the parameter.
+        :param value_type: The type of the values, or an empty string to infer it from the values.
         """
         self.title = title
         self.name = name
         self.unit = unit
+        self.value_type = value_type
         self.is_derived = False
         self.derived_expression = ''
         self.format_expression = ''
 
-    def format_value(self, value: Union[int, float]) -> str:
+    def compile_expressions(self):
+        """
+        Compile the derived and format expressions, to report syntax errors before any value is processed.
+        """
+        for kind, expression in (('derived', self.derived_expression), ('format', self.format_expression)):
+            if not expression:
+                continue
+            try:
+                compile_expression(expression)
+            except SyntaxError as err:
+                raise ScriptError(f'Syntax error in the {kind} expression of parameter "{self.name}": '
+                                  f'{err.msg}: {expression}')
+
+    def format_value(self, value: Union[int, float, Decimal, str]) -> str:
         if self.format_expression:
-            formatted_value = eval(self.format_expression, {'value': value})
+            formatted_value = eval(compile_expression(self.format_expression), {'value': value})
         else:
             if isinstance(value, float):
                 formatted_value = f'{value:.2}'
@@ -57,7 +93,7 @@ class ModelGroup:
     """
     A group of models.
     """
-    def __init__(self, title: str, models: list[Model]):
+    def __init__(self, title: str, models: ModelTable):
         self.title = title
         self.models = models
 
@@ -95,6 +131,7 @@ class Data:
             id_parameter_title = 'title'
             id_parameter_name = 'name'
             id_parameter_unit = 'unit'
+            id_parameter_type = 'type'
         else:
             id_component_name = 'component_name'
             id_parameter = 'parameter'
@@ -102,6 +139,7 @@ class Data:
             id_parameter_title = 'title'
             id_parameter_name = 'name'
             id_parameter_unit = 'unit'
+            id_parameter_type = 'type'
         self.component_name = data[id_component_name]
         self.parameter: dict[str, Parameter] = {}
         for parameter_data in data[id_parameter]:
@@ -109,11 +147,11 @@ class Data:
                 parameter_data[id_parameter_title],
                 parameter_data[id_parameter_name],
                 parameter_data[id_parameter_unit])
+            if id_parameter_type in parameter_data:
+                new_parameter.value_type = check_value_type(parameter_data[id_parameter_type], new_parameter.name)
             self.parameter[new_parameter.name] = new_parameter
-        self.models: list[Model] = []
-        for model_data in data[id_model]:
-            new_model = Model.from_data(model_data, data_format, project_dir)
-            self.models.append(new_model)
+        self.models = ModelTable.from_models(
+            Model.from_data(model_data, data_format, project_dir) for model_data in data[id_model])
 
 
 class CatalogWorkingSet:
@@ -131,6 +169,8 @@ class CatalogWorkingSet:
     ]
 
     CATALOG_NAME = 'catalog'
+    DOCUMENT_CLASS = 'scrartcl'
+    MANIFEST_NAME = '.catalog-manifest.json'
 
     def __init__(self):
         """
@@ -138,6 +178,13 @@ class CatalogWorkingSet:
         """
         self.project_dir = Path()
         self.verbose = False
+        self.force = False  # Build the catalog, even if no input changed since the last build.
+        self.jobs: int = default_job_count()  # The maximum number of concurrent workers.
+        self.image_backend: str = 'convert'  # The backend used to convert the images.
+        self.image_batch_size: int = 32  # The number of images per process for the `convert-batch` backend.
+        self.image_dpi: int = DEFAULT_IMAGE_DPI  # The resolution of the embedded images.
+        self.latex_options = LatexOptions()  # The options for compiling the LaTeX documents.
+        self.vectorize_derived = False  # Evaluate the derived parameters for whole columns with NumPy.
         self.log: Optional[logging.Logger] = None
         self.model_files: dict[str, Path] = {}  # A map with all model files.
         self.image_files: dict[str, Path] = {}  # A map with all images found in the project directory
@@ -147,21 +194,30 @@ class CatalogWorkingSet:
         self.drawing_image: str = ''
         self.table_columns: int = 1
 
-        self.intermediate_path = Path()
+        self.intermediate_path: Optional[Path] = None
+        self.cache_path: Optional[Path] = None  # Persistent cache, which is kept between runs.
+        self.image_store: Optional[ImageStore] = None  # A shared image store, converted by its owner.
+        self.image_cache: Optional[ImageCache] = None  # The cache for converted images, see `get_image_cache`.
+        self.build_manifest: Optional[BuildManifest] = None  # The inputs of the current build.
+        self.generator_digest: str = ''  # A hash of the generator sources and templates.
 
-        self.images_to_compress: list[str] = []  # A list of images that need compression.
+        self.images_to_compress: list[tuple[str, str]] = []  # A list of images that need compression and their usage.
         self.compressed_images: dict[str, Path] = {}  # A map with all compressed images (original_name -> compressed)
+        self.image_conversions: list[ImageConversion] = []  # The conversions for the compressed images.
+        self.image_fingerprints: dict[str, list[int]] = {}  # The size and modification time of the used images.
         self.title: str = ''
         self.parameter_order: list[str] = []  # The order of the parameters for the tables and index.
         self.detail_order: list[str] = []     # The order of displayed attributes below the model image.
         self.all_parameters: list[str] = []   # A sorted list of all parameter names.
         self.parameter_map: dict[str, Parameter] = {}  # All configured parameters.
+        self.value_types: dict[str, str] = {}  # The type of the values of each non-derived parameter.
         self.primary_group: str = ''
-        self.sorted_models: list[Model] = []
+        self.sorted_models = ModelTable()
         self.model_groups: list[ModelGroup] = []  # The main model groups.
         self.value_sets: dict[str, list[(Union[int, float], str)]] = {}
         self.table_groups: list[TableGroup] = []
         self.recommendations: list[(str, str)] = []
+        self.latex_digest: str = ''  # The SHA-256 hash of the written LaTeX document of the catalog.
 
     def parse_arguments(self):
         """
@@ -176,6 +232,10 @@ class CatalogWorkingSet:
         parser.add_argument('-v', '--verbose',
                             action='store_true',
                             help='Enable verbose messages.')
+        parser.add_argument('-f', '--force',
+                            action='store_true',
+                            help='Build the catalog, even if no input changed since the last build.')
+        add_build_arguments(parser, 'project directory')
         args = parser.parse_args()
         self.project_dir = Path(args.project_dir)
         if not self.project_dir.is_dir():
@@ -183,6 +243,8 @@ class CatalogWorkingSet:
         self.intermediate_path = self.project_dir / 'tmp'
         if args.verbose:
             self.verbose = True
+        self.force = args.force
+        apply_build_arguments(self, args)
 
     def init_logging(self):
         """
@@ -199,7 +261,13 @@ class CatalogWorkingSet:
         Scan for relevant files to store the paths.
         """
         self.log.info('Scanning for files.')
+        # Resolve the paths, as the cache directory can be given as absolute path and the project as relative one.
+        project_path = self.project_dir.resolve()
+        excluded_paths = list([p.resolve() for p in (self.cache_path, self.intermediate_path) if p is not None])
+        excluded_paths = list([p for p in excluded_paths if p.is_relative_to(project_path)])
         for file in self.project_dir.rglob(pattern='*'):
+            if excluded_paths and any(file.resolve().is_relative_to(p) for p in excluded_paths):
+                continue  # Ignore the generated images.
             if file.name.endswith(('.3mf', '.stl')):
                 self.model_files[file.name] = file
                 if self.verbose:
@@ -211,6 +279,56 @@ class CatalogWorkingSet:
         self.log.info(f'done scanning. found {len(self.model_files)} model files and '
                       f'{len(self.image_files)} image files.')
 
+    def create_build_manifest(self, path: Path) -> BuildManifest:
+        """
+        Record the inputs of the project, after the files were scanned.
+
+        :param path: The path of the manifest file.
+        :return: The new manifest.
+        """
+        manifest = BuildManifest(path)
+        for name in ('parameters.json', 'parameter.toml', 'config.ini'):
+            manifest.add_file(f'project/{name}', self.project_dir / name)
+        generator_dir = Path(__file__).parent
+        manifest.add_file(f'generator/{Path(__file__).name}', Path(__file__))
+        manifest.add_files('generator/lib', generator_dir / 'lib', '*.py')
+        manifest.add_files('templates', generator_dir / 'templates', '*')
+        self.generator_digest = manifest.digest('generator/', 'templates/')
+        # The scanned files decide which images and model files are referenced.
+        manifest.add_value('scan', sorted(
+            p.relative_to(self.project_dir).as_posix()
+            for p in itertools.chain(self.model_files.values(), self.image_files.values())))
+        manifest.add_value('options', {
+            'image_backend': self.image_backend,
+            'image_dpi': self.image_dpi,
+            'latex_max_passes': self.latex_options.max_passes,
+        })
+        return manifest
+
+    def check_build_manifest(self) -> bool:
+        """
+        Record the inputs of this build and compare them with the previous build.
+
+        :return: `True` if the catalog is up to date and the build can be skipped.
+        """
+        manifest = self.create_build_manifest(self.project_dir / self.MANIFEST_NAME)
+        self.build_manifest = manifest
+        if self.force:
+            return False
+        if not manifest.is_up_to_date(BuildManifest.load(manifest.path)):
+            return False
+        self.log.info('No input changed since the last build. Use `--force` to build the catalog anyway.')
+        return True
+
+    def write_build_manifest(self):
+        """
+        Write the manifest of this build, with the fingerprints of all referenced images and the PDF.
+        """
+        for image_file, _ in self.images_to_compress:
+            self.build_manifest.add_fingerprint(self.image_files[image_file])
+        self.build_manifest.add_fingerprint(self.catalog_pdf_path())
+        self.build_manifest.save()
+
     def read_parameter_file(self):
         """
         Read all values from the JSON or TOML file.
@@ -264,7 +382,7 @@ class CatalogWorkingSet:
             derived_parameters: list[str] = config['main']['derived_parameters'].split()
         else:
             derived_parameters: list[str] = []
-        self.all_parameters = list(set(self.parameter_order).union(set(self.detail_order)))
+        self.all_parameters = sorted(set(self.parameter_order).union(set(self.detail_order)))
 
         # Check the title and drawing images.
         if self.title_image.endswith(('.jpg', '.jp2', '.png', '.webp')):
@@ -292,11 +410,11 @@ class CatalogWorkingSet:
             self.title_image = name
             self.title_image_from_models = True
         if self.title_image:
-            self.images_to_compress.append(self.title_image)
+            self.images_to_compress.append((self.title_image, 'title'))
         if self.drawing_image:
             if self.drawing_image not in self.image_files:
                 raise ScriptError(f'Could not find drawing image `{self.drawing_image}`.')
-            self.images_to_compress.append(self.drawing_image)
+            self.images_to_compress.append((self.drawing_image, 'drawing'))
 
         # Check the parameters.
         for parameter_name in self.all_parameters:
@@ -322,93 +440,138 @@ class CatalogWorkingSet:
                 parameter.format_expression = str(config['format'][parameter_name]).strip()
             if parameter_name in derived_parameters:
                 parameter.is_derived = True
+            parameter.compile_expressions()
             self.parameter_map[parameter_name] = parameter
         for name, title in self.RECOMMENDATIONS:
             if name in config['recommendations']:
                 self.recommendations.append((title, str(config['recommendations'][name])))
 
+    def _original_column(self, parameter_name: str):
+        try:
+            return self.data.models.original_column(parameter_name)
+        except KeyError:
+            raise ScriptError(f'Not all models have a value for parameter `{parameter_name}`.')
+
+    def infer_schema(self):
+        """
+        Choose a single type for the values of each parameter.
+
+        The type is taken from the parameter file, or inferred from all values of the parameter.
+        """
+        self.value_types = {}
+        for parameter_name in self.all_parameters:
+            parameter = self.parameter_map[parameter_name]
+            if parameter.is_derived and parameter.derived_expression:
+                continue
+            value_type = parameter.value_type or infer_value_type(self._original_column(parameter.name))
+            if self.verbose:
+                self.log.debug(f'Parameter `{parameter.name}` has the type `{value_type}`.')
+            self.value_types[parameter.name] = value_type
+
     def process_models(self):
         """
         Process all model entries
         """
-        for model in self.data.models:
-            if self.verbose:
-                self.log.debug(f'Processing model {model.part_id}')
-            values: dict[str, Union[int, float, str]] = {}
-            formatted_values: dict[str, str] = {}
-            # first pre-process all original values.
-            for parameter_name in self.all_parameters:
-                parameter = self.parameter_map[parameter_name]
-                if parameter.is_derived and parameter.derived_expression:
-                    continue
-                value = model.original_values[parameter.name]
-                if '.' in str(value):
-                    value = float(value)
-                else:
-                    try:
-                        value = int(value)
-                    except ValueError:
-                        pass
-                values[parameter.name] = value
-            for parameter_name in self.all_parameters:
-                parameter = self.parameter_map[parameter_name]
-                if parameter.is_derived and parameter.derived_expression:
-                    value = eval(parameter.derived_expression, {'values': values})
-                    values[parameter.name] = value
-                else:
-                    value = values[parameter.name]
-                formatted_values[parameter.name] = parameter.format_value(value)
-            model.values = values
-            model.formatted_values = formatted_values
-            model.model_files = list(
-                [self.model_files[Path(p).name].relative_to(self.project_dir) for p in model.model_files])
-            for image_file in model.image_files:
-                if image_file.name not in self.image_files:
-                    raise ScriptError(f'Could not find image file `{image_file.name}` for model `{model.part_id}`.')
+        models = self.data.models
+        if any(name not in self.value_types for name in self.all_parameters
+               if not (self.parameter_map[name].is_derived and self.parameter_map[name].derived_expression)):
+            self.infer_schema()  # The schema stage did not run, like in scripts that call the steps directly.
+        if self.verbose:
+            for part_id in models.part_ids:
+                self.log.debug(f'Processing model {part_id}')
+        # first convert all original values, a whole column at once.
+        for parameter_name, value_type in self.value_types.items():
+            models.set_values(parameter_name,
+                              convert_values(self._original_column(parameter_name), value_type, parameter_name))
+        # Evaluate the derived parameters for all models, in the order of the parameters.
+        evaluator = DerivedEvaluator(models, self.vectorize_derived)
+        for parameter_name in self.all_parameters:
+            parameter = self.parameter_map[parameter_name]
+            if parameter.is_derived and parameter.derived_expression:
+                evaluator.evaluate(compile_expression(parameter.derived_expression), parameter.derived_expression,
+                                   parameter.name)
+        for parameter_name in self.all_parameters:
+            models.set_formatted_values(
+                parameter_name, models.map_column(parameter_name, self.parameter_map[parameter_name].format_value))
+        relative_model_files: dict[str, str] = {}
+        for index, model_files in enumerate(models.model_files):
+            names = list([Path(p).name for p in model_files])
+            for name in names:
+                if name not in relative_model_files:
+                    relative_model_files[name] = str(self.model_files[name].relative_to(self.project_dir))
+            models.model_files[index] = tuple([relative_model_files[name] for name in names])
+        for part_id, image_files in zip(models.part_ids, models.image_files):
+            for image_file in image_files:
+                image_name = Path(image_file).name
+                if image_name not in self.image_files:
+                    raise ScriptError(f'Could not find image file `{image_name}` for model `{part_id}`.')
                 if self.verbose:
-                    self.log.debug(f'- adding image `{image_file.name}` for compression.')
-                self.images_to_compress.append(image_file.name)
-        self.sorted_models = self.data.models.copy()
-        self.sorted_models.sort(key=lambda x: itemgetter(*self.parameter_order)(x.values))
+                    self.log.debug(f'- adding image `{image_name}` for compression.')
+                self.images_to_compress.append((image_name, 'model'))
+        self.sorted_models = models.take(models.sorted_indexes(self.parameter_order))
 
-    def compress_images(self):
+    def get_image_cache(self) -> ImageCache:
         """
-        Create small version of the images to embed in the PDF
+        Get the cache for converted images, which is created once and shared by all steps.
         """
-        self.log.info('Compressing images.')
-        compressed_images_path = self.intermediate_path / 'compressed_images'
-        compressed_images_path.mkdir(parents=True, exist_ok=True)
-        for image_file in self.images_to_compress:
+        if self.image_store:
+            return self.image_store.cache
+        if self.image_cache is None:
+            if self.cache_path is None:
+                raise ScriptError('No cache directory is set for the converted images.')
+            self.image_cache = ImageCache(self.cache_path)
+        return self.image_cache
+
+    def plan_images(self):
+        """
+        Assign a compressed version to each image that is embedded in the PDF.
+        """
+        if self.image_store:
+            store = self.image_store
+        else:
+            store = ImageStore(self.intermediate_path / 'compressed_images', self.get_image_cache())
+        for image_file, usage in self.images_to_compress:
             # Convert all images into a highly compressed JPEG, as they get embedded 1:1 into the PDF
-            original_path = self.image_files[image_file]
-            target_path = compressed_images_path / original_path.with_suffix('.jpg').name
-            if not target_path.is_file():  # Don't convert if the file is already converted.
-                self.log.info(f'Converting: {original_path.name} => {target_path.name}...')
-                args = [
-                    'convert',
-                    '-quality', '50',
-                    '-resize', '800x800',
-                    str(original_path),
-                    str(target_path)
-                ]
-                subprocess.run(args)
-            self.compressed_images[image_file] = target_path.relative_to(self.intermediate_path)
+            width = image_width_for_usage(usage, self.image_dpi)
+            conversion = store.add(self.image_files[image_file], width)
+            self.compressed_images[image_file] = conversion.target_path.relative_to(self.intermediate_path)
+        if not self.image_store:  # The images in a shared store are converted by the owner of the store.
+            self.image_conversions = store.conversions
+
+    def convert_images(self):
+        """
+        Create the compressed images that were assigned by `plan_images`.
+        """
+        self.log.info('Compressing images.')
+        if self.image_conversions:
+            (self.intermediate_path / 'compressed_images').mkdir(parents=True, exist_ok=True)
+            converter = ImageConverter(self.get_image_cache(), self.jobs, self.log, self.image_backend,
+                                       batch_size=self.image_batch_size)
+            converter.convert(self.image_conversions)
         self.log.info('done compressing images')
 
+    def compress_images(self):
+        """
+        Create small version of the images to embed in the PDF
+        """
+        self.plan_images()
+        self.convert_images()
+
+    def fingerprint_images(self):
+        """
+        Record the size and modification time of all embedded images, to detect changed images.
+        """
+        self.image_fingerprints = dict(
+            (name, file_fingerprint(self.image_files[name])) for name, _ in self.images_to_compress)
+
     def _create_value_sets(self):
         """
         Generate value sets for each parameter.
         """
-        value_sets: dict[str, set] = {}
-        for parameter_name in self.parameter_order:
-            value_sets[parameter_name] = set()
-        for model in self.data.models:
-            for parameter_name in self.parameter_order:
-                value_sets[parameter_name].add(model.values[parameter_name])
         for parameter_name in self.parameter_order:
             parameter = self.parameter_map[parameter_name]
-            self.value_sets[parameter_name] = \
-                list([(v, parameter.format_value(v)) for v in sorted(list(value_sets[parameter_name]))])
+            value_set = set(self.data.models.column(parameter_name))
+            self.value_sets[parameter_name] = list([(v, parameter.format_value(v)) for v in sorted(list(value_set))])
 
     def _create_main_model_groups(self):
         """
@@ -421,27 +584,20 @@ class CatalogWorkingSet:
         primary_group_parameters: list[Parameter] = list([self.parameter_map[g] for g in self.primary_group])
         if len(self.primary_group) == 1:
             primary_group_parameter = primary_group_parameters[0]
+            groups = self.sorted_models.group_indexes(self.primary_group)
             for g_value, g_formatted in self.value_sets[primary_group_parameter.name]:
                 title = f'Models with {primary_group_parameter.title} = {g_formatted}'
-                models = [m for m in self.sorted_models if m.values[self.primary_group[0]] == g_value]
+                models = self.sorted_models.take(groups.get((g_value,), []))
                 self.model_groups.append(ModelGroup(title, models))
         elif len(self.primary_group) == 2:
+            groups = self.sorted_models.group_indexes(self.primary_group)
             combinations = itertools.product(self.value_sets[primary_group_parameters[0].name],
                                              self.value_sets[primary_group_parameters[1].name])
             for c in combinations:
                 title = 'Models with'
-                models: list[Model] = []
                 for i in range(len(primary_group_parameters)):
                     title += f' {primary_group_parameters[i].title} = {c[i][1]}'
-                for m in self.sorted_models:
-                    matches = True
-                    for i in range(len(primary_group_parameters)):
-                        if c[i][0] != m.values[primary_group_parameters[i].name]:
-                            matches = False
-                            break
-                    if not matches:
-                        continue
-                    models.append(m)
+                models = self.sorted_models.take(groups.get((c[0][0], c[1][0]), []))
                 self.model_groups.append(ModelGroup(title, models))
         else:
             raise ValueError('Not more than two parameters supported for primary group.')
@@ -457,6 +613,7 @@ class CatalogWorkingSet:
                 continue  # Skip derived parameter.
             title = f'Tables Grouped by {parameter.title}'
             tables: list[Table] = []
+            groups = self.sorted_models.group_indexes([parameter.name])
             for g_value, g_formatted in self.value_sets[parameter.name]:
                 sub_title = f'{parameter.title} = {g_formatted}'
                 fields = ['Part ID']
@@ -466,17 +623,9 @@ class CatalogWorkingSet:
                         p = self.parameter_map[pn]
                         fields.append(p.title)
                         columns.append(p.name)
-                rows = []
-                for model in self.sorted_models:
-                    if model.values[parameter.name] != g_value:
-                        continue
-                    row = []
-                    for column in columns:
-                        if column == 'part_id':
-                            row.append(model.part_id)
-                        else:
-                            row.append(model.formatted_values[column])
-                    rows.append(row)
+                column_values = list([self.sorted_models.part_ids if c == 'part_id'
+                                      else self.sorted_models.formatted_values[c] for c in columns])
+                rows = list([list([v[i] for v in column_values]) for i in groups.get((g_value,), [])])
                 tables.append(Table(sub_title, fields, rows))
             self.table_groups.append(TableGroup(title, tables))
 
@@ -488,15 +637,15 @@ class CatalogWorkingSet:
         self._create_main_model_groups()
         self._generate_parameter_tables()
 
-    def write_latex_file(self, path: Path, template_name: str, label: str = ''):
+    def latex_parameters(self, label: str = '') -> dict:
         """
-        Write the LaTeX file to create the PDF
+        Collect the parameters for the LaTeX templates.
+
+        The parameters can be reused to render several templates with the same data.
 
-        :param path: The path of the LaTeX file.
-        :param template_name: The name of the template to use.
         :param label: Optional label for the whole chapter.
+        :return: A dictionary with the variables for the templates.
         """
-        self.log.info(f'Generating and writing LaTeX file to: {path}')
         title = self.title
         if not title:
             title = self.data.component_name
@@ -514,21 +663,114 @@ class CatalogWorkingSet:
             'table_columns': self.table_columns,
             'recommendations': self.recommendations,
             'compressed_images': self.compressed_images,
+            'document_class': self.DOCUMENT_CLASS,
+            'latex_format': self.latex_options.format_dir is not None,
+            'body_file': '',  # A file with the rendered `latex/catalog-body.tex`, instead of including it.
         }
         if self.drawing_image:
             parameters['drawing_image'] = self.drawing_image
+        return parameters
+
+    def write_latex_file(self, path: Path, template_name: str, label: str = '', parameters: Optional[dict] = None):
+        """
+        Write the LaTeX file to create the PDF
+
+        :param path: The path of the LaTeX file.
+        :param template_name: The name of the template to use.
+        :param label: Optional label for the whole chapter.
+        :param parameters: The parameters from `latex_parameters`, if they are shared with other templates.
+        """
+        self.log.info(f'Generating and writing LaTeX file to: {path}')
+        if parameters is None:
+            parameters = self.latex_parameters(label)
         template_path = Path(__file__).parent / 'templates'
         write_latex_template(template_path, template_name, parameters, path)
         self.log.info('done writing the LaTeX file.')
 
+    def latex_path(self) -> Path:
+        """
+        Get the path of the LaTeX document of the catalog.
+        """
+        return self.intermediate_path / f'{self.CATALOG_NAME}.tex'
+
+    def write_latex_document(self):
+        """
+        Write the LaTeX document of the catalog.
+        """
+        path = self.latex_path()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.write_latex_file(path, 'latex/catalog.tex')
+        with path.open('rb') as file:
+            self.latex_digest = hashlib.file_digest(file, 'sha256').hexdigest()
+
+    def catalog_pdf_path(self) -> Path:
+        """
+        Get the path of the generated catalog PDF.
+        """
+        return self.project_dir / f'{self.data.component_name}-catalog.pdf'
+
     def generate_pdf(self):
         """
-        Generate the LaTeX document.
+        Generate the PDF from the written LaTeX document.
+        """
+        tex_path = self.latex_path()
+        template_path = Path(__file__).parent / 'templates'
+        format_path = latex_format_for(template_path, self.DOCUMENT_CLASS, self.latex_options, self.log)
+        create_pdf_from_latex(tex_path, self.catalog_pdf_path(), self.log, self.latex_options,
+                              format_path=format_path)
+
+    def compile_catalog(self):
+        """
+        Create the compressed images and compile the catalog PDF.
+        """
+        self.convert_images()
+        self.generate_pdf()
+
+    def build_stages(self) -> list[Stage]:
+        """
+        Get the stages to build the catalog.
+
+        The stages that read files from the project are not cached, all other stages are only
+        run if one of their inputs changed.
         """
-        tex_path = self.intermediate_path / f'{self.CATALOG_NAME}.tex'
-        self.write_latex_file(tex_path, 'latex/catalog.tex')
-        target_path = self.project_dir / f'{self.data.component_name}-catalog.pdf'
-        create_pdf_from_latex(tex_path, target_path, self.log)
+        return [
+            Stage('parameters', self.read_parameter_file, [], ['data'], cached=False),
+            Stage('configuration', self.read_configuration,
+                  ['data', 'image_files'],
+                  ['title', 'parameter_order', 'detail_order', 'primary_group', 'title_image',
+                   'title_image_from_models', 'drawing_image', 'table_columns', 'all_parameters',
+                   'parameter_map', 'recommendations', 'images_to_compress'],
+                  cached=False),
+            Stage('schema', self.infer_schema,
+                  ['data', 'all_parameters', 'parameter_map'],
+                  ['value_types']),
+            Stage('models', self.process_models,
+                  ['data', 'model_files', 'image_files', 'all_parameters', 'parameter_map', 'parameter_order',
+                   'value_types', 'images_to_compress', 'project_dir'],
+                  ['data', 'sorted_models', 'images_to_compress']),
+            Stage('image-fingerprints', self.fingerprint_images,
+                  ['images_to_compress', 'image_files'],
+                  ['image_fingerprints'],
+                  cached=False),
+            # The plan merges images with identical contents, so it depends on the state of the image files.
+            Stage('images', self.plan_images,
+                  ['images_to_compress', 'image_files', 'image_fingerprints', 'image_dpi', 'intermediate_path'],
+                  ['compressed_images', 'image_conversions']),
+            Stage('tables', self.generate_tables,
+                  ['data', 'sorted_models', 'parameter_order', 'parameter_map', 'primary_group'],
+                  ['value_sets', 'model_groups', 'table_groups']),
+            Stage('latex', self.write_latex_document,
+                  ['data', 'title', 'detail_order', 'parameter_map', 'model_groups', 'table_groups',
+                   'title_image', 'drawing_image', 'table_columns', 'recommendations', 'compressed_images',
+                   'latex_options'],
+                  ['latex_digest'],
+                  output_files=lambda: [self.latex_path()]),
+            Stage('pdf', self.compile_catalog,
+                  ['data', 'project_dir', 'latex_digest', 'image_conversions', 'image_fingerprints',
+                   'image_backend', 'latex_options'],
+                  [],
+                  output_files=lambda: [self.catalog_pdf_path()]),
+        ]
 
     def clean_up(self):
         """
@@ -541,12 +783,11 @@ class CatalogWorkingSet:
             self.parse_arguments()
             self.init_logging()
             self.scan_files()
-            self.read_parameter_file()
-            self.read_configuration()
-            self.process_models()
-            self.compress_images()
-            self.generate_tables()
-            self.generate_pdf()
+            if self.check_build_manifest():
+                return
+            runner = StageRunner(self, self.cache_path / 'stages', self.log, self.generator_digest, force=self.force)
+            runner.run(self.build_stages())
+            self.write_build_manifest()
             self.clean_up()
         except ScriptError as err:
             if self.log:
@@ -8,7 +8,6 @@ import configparser
 import itertools
 import json
 import logging
-import subprocess
 from operator import itemgetter
 from pathlib import Path
 from typing import Optional, Union
@@ -16,8 +15,14 @@ from jinja2 import Environment, FileSystemLoader
 
 from generate_project_catalog import CatalogWorkingSet
 from lib.exceptions import ScriptError
-from lib.latex import escape_latex, write_latex_template, create_pdf_from_latex
+from lib.images import (DEFAULT_IMAGE_DPI, ImageCache, ImageConverter, ImageStore, default_job_count,
+                        image_width_for_usage)
+from lib.latex import (LatexDocument, LatexOptions, escape_latex, write_latex_template, create_pdfs_from_latex,
+                       latex_format_for)
+from lib.manifest import BuildManifest
 from lib.model import Model
+from lib.options import add_build_arguments, apply_build_arguments
+from lib.pdf import extract_pdf_pages
 
 
 class SubProject:
@@ -34,6 +39,7 @@ class SuperCatalogWorkingSet:
     """
 
     CATALOG_NAME = 'super-catalog'
+    DOCUMENT_CLASS = 'scrbook'
 
     def __init__(self):
         """
@@ -41,7 +47,17 @@ class SuperCatalogWorkingSet:
         """
         self.project_dir = Path()
         self.intermediate_path = Path()
+        self.cache_path = Path()  # Persistent cache, which is kept between runs.
+        self.image_store: Optional[ImageStore] = None  # The image store shared by all sub projects.
         self.verbose = False
+        self.force = False  # Regenerate all chapters and sub catalogs, even if their inputs did not change.
+        self.jobs: int = default_job_count()  # The maximum number of concurrent workers.
+        self.image_backend: str = 'convert'  # The backend used to convert the images.
+        self.image_batch_size: int = 32  # The number of images per process for the `convert-batch` backend.
+        self.image_dpi: int = DEFAULT_IMAGE_DPI  # The resolution of the embedded images.
+        self.latex_options = LatexOptions()  # The options for compiling the LaTeX documents.
+        self.vectorize_derived = False  # Evaluate the derived parameters for whole columns with NumPy.
+        self.slice_sub_catalogs = False  # If the sub catalogs are extracted from the super catalog PDF.
         self.log: Optional[logging.Logger] = None
         self.sub_projects: list[SubProject] = []
         self.title: str = ''
@@ -49,6 +65,8 @@ class SuperCatalogWorkingSet:
         self.catalog_pdf_name: str = ''
         self.sub_catalog_latex: list[(Path, Path)] = []
         self.chapters: list[str] = []
+        self.sub_project_manifests: dict[str, BuildManifest] = {}  # The inputs of the sub projects.
+        self.unchanged_sub_projects: set[str] = set()  # The sub projects whose LaTeX files and sub catalog are kept.
 
     def parse_arguments(self):
         """
@@ -63,6 +81,14 @@ class SuperCatalogWorkingSet:
         parser.add_argument('-v', '--verbose',
                             action='store_true',
                             help='Enable verbose messages.')
+        parser.add_argument('-f', '--force',
+                            action='store_true',
+                            help='Regenerate all chapters and sub catalogs, even if their inputs did not change.')
+        add_build_arguments(parser, 'super project directory')
+        parser.add_argument('--slice-sub-catalogs',
+                            action='store_true',
+                            help='Extract the sub catalogs from the pages of the super catalog, instead of '
+                                 'compiling them separately. Requires `qpdf`.')
         args = parser.parse_args()
         self.project_dir = Path(args.project_dir)
         if not self.project_dir.is_dir():
@@ -71,6 +97,9 @@ class SuperCatalogWorkingSet:
         self.intermediate_path.mkdir(parents=True, exist_ok=True)
         if args.verbose:
             self.verbose = True
+        self.force = args.force
+        apply_build_arguments(self, args)
+        self.slice_sub_catalogs = args.slice_sub_catalogs
 
     def init_logging(self):
         """
@@ -106,24 +135,25 @@ class SuperCatalogWorkingSet:
         if not self.title_image.is_file():
             raise ScriptError('Specified title image is missing.')
 
+    def init_image_store(self):
+        """
+        Create the image store that is shared by the super catalog and all sub projects.
+        """
+        compressed_images_path = self.intermediate_path / 'compressed_images'
+        compressed_images_path.mkdir(parents=True, exist_ok=True)
+        self.image_store = ImageStore(compressed_images_path, ImageCache(self.cache_path))
+        width = image_width_for_usage('title', self.image_dpi)
+        self.title_image = self.image_store.add(self.title_image, width).target_path
+
     def compress_images(self):
         """
-        Create small version of the title image PDF
-        """
-        self.log.info('Compressing image')
-        target_path = self.intermediate_path / 'super-catalog-title.jpg'
-        if not target_path.is_file():
-            self.log.info(f'Converting: {self.title_image.name}...')
-            args = [
-                'convert',
-                '-quality', '50',
-                '-resize', '800x800',
-                str(self.title_image),
-                str(target_path)
-            ]
-            subprocess.run(args)
-        self.title_image = target_path
-        self.log.info('done compressing image')
+        Create small versions of all images of the super catalog and the sub projects.
+        """
+        self.log.info(f'Compressing {len(self.image_store.conversions)} unique images')
+        converter = ImageConverter(self.image_store.cache, self.jobs, self.log, self.image_backend,
+                                   batch_size=self.image_batch_size)
+        converter.convert(self.image_store.conversions)
+        self.log.info('done compressing images')
 
     def process_subprojects(self):
         self.log.info('Processing sub projects')
@@ -131,22 +161,56 @@ class SuperCatalogWorkingSet:
             self.log.info(f'Processing {sub_project.name}')
             ws = CatalogWorkingSet()
             ws.log = self.log
+            ws.jobs = self.jobs
+            ws.cache_path = self.cache_path
+            ws.image_store = self.image_store
+            ws.image_dpi = self.image_dpi
+            ws.image_backend = self.image_backend
+            ws.image_batch_size = self.image_batch_size
+            ws.vectorize_derived = self.vectorize_derived
+            ws.latex_options = self.latex_options
             ws.project_dir = self.project_dir / sub_project.name
             ws.intermediate_path = self.intermediate_path
             ws.scan_files()
+            manifest = ws.create_build_manifest(self.cache_path / 'sub-projects' / f'{sub_project.name}.json')
+            manifest.add_file(f'generator/{Path(__file__).name}', Path(__file__))
             ws.read_parameter_file()
             ws.read_configuration()
+            ws.infer_schema()
             ws.process_models()
             ws.compress_images()
-            ws.generate_tables()
-            latex_path = self.intermediate_path / f'{sub_project.name}-catalog.tex'
-            ws.write_latex_file(latex_path, 'latex/catalog.tex', label=sub_project.name)
-            self.sub_catalog_latex.append((ws.project_dir, latex_path.relative_to(self.intermediate_path)))
-            latex_path = self.intermediate_path / f'{sub_project.name}-chapter.tex'
-            ws.write_latex_file(latex_path, 'latex/catalog-part.tex', label=sub_project.name)
-            self.chapters.append(str(latex_path.relative_to(self.intermediate_path)))
+            # The names of the compressed images depend on the images of the other sub projects.
+            manifest.add_value('compressed_images', ws.compressed_images)
+            manifest.add_value('super', {
+                'latex_format': self.latex_options.format_dir is not None,
+                'slice_sub_catalogs': self.slice_sub_catalogs,
+            })
+            for image_file, _ in ws.images_to_compress:
+                manifest.add_fingerprint(ws.image_files[image_file])
+            self.sub_project_manifests[sub_project.name] = manifest
+            catalog_path = self.intermediate_path / f'{sub_project.name}-catalog.tex'
+            chapter_path = self.intermediate_path / f'{sub_project.name}-chapter.tex'
+            body_path = self.intermediate_path / f'{sub_project.name}-body.tex'
+            if not self.force and manifest.is_up_to_date(BuildManifest.load(manifest.path)):
+                self.log.info(f'No input of {sub_project.name} changed, keeping its LaTeX files and sub catalog.')
+                self.unchanged_sub_projects.add(sub_project.name)
+            else:
+                ws.generate_tables()
+                # The models and tables are rendered once, for the sub catalog and the chapter.
+                parameters = ws.latex_parameters(label=sub_project.name)
+                ws.write_latex_file(body_path, 'latex/catalog-body.tex', parameters=parameters)
+                parameters['body_file'] = str(body_path.relative_to(self.intermediate_path).as_posix())
+                if not self.slice_sub_catalogs:
+                    ws.write_latex_file(catalog_path, 'latex/catalog.tex', parameters=parameters)
+                ws.write_latex_file(chapter_path, 'latex/catalog-part.tex', parameters=parameters)
+            self.sub_catalog_latex.append((ws.project_dir, catalog_path.relative_to(self.intermediate_path)))
+            self.chapters.append(str(chapter_path.relative_to(self.intermediate_path)))
             sub_project.title = ws.title
-            sub_project.title_image = ws.compressed_images[ws.title_image]
+            # This only records that the title image is also used as overview tile. The tile shares the conversion
+            # of the chapter title image, which is wider, so the converted image does not change.
+            overview_image = self.image_store.add(ws.image_files[ws.title_image],
+                                                  image_width_for_usage('overview', self.image_dpi))
+            sub_project.title_image = overview_image.target_path.relative_to(self.intermediate_path)
         self.log.info('done processing sub projects')
 
     def write_latex_file(self, path: Path, template_name: str):
@@ -162,6 +226,8 @@ class SuperCatalogWorkingSet:
             'title_image': self.title_image.relative_to(self.intermediate_path),
             'chapters': self.chapters,
             'sub_projects': self.sub_projects,
+            'document_class': self.DOCUMENT_CLASS,
+            'latex_format': self.latex_options.format_dir is not None,
         }
         template_path = Path(__file__).parent / 'templates'
         write_latex_template(template_path, template_name, parameters, path)
@@ -170,26 +236,73 @@ class SuperCatalogWorkingSet:
     def generate_pdf(self):
         """
         Generate the PDFs from the documents.
+
+        The super catalog is always typeset in full, including the chapters of unchanged sub projects, as
+        `\\includeonly` would drop them from the PDF. Only the auxiliary files of the previous build are reused,
+        which saves PDFLaTeX passes. The separate sub catalogs are only compiled for changed sub projects.
         """
         self.log.info(f'Generating super catalog PDF ...')
         tex_path = self.intermediate_path / f'{self.CATALOG_NAME}.tex'
         self.write_latex_file(tex_path, 'latex/super-catalog.tex')
-        target_path = self.project_dir / self.catalog_pdf_name
-        create_pdf_from_latex(tex_path, target_path, self.log)
-        for project_dir, latex_file in self.sub_catalog_latex:
+        template_path = Path(__file__).parent / 'templates'
+        format_path = latex_format_for(template_path, self.DOCUMENT_CLASS, self.latex_options, self.log)
+        document = LatexDocument(tex_path, self.project_dir / self.catalog_pdf_name, format_path)
+        if self.slice_sub_catalogs:
+            create_pdfs_from_latex([document], self.log, self.jobs, self.latex_options)
+            self.slice_sub_catalog_pdfs(document)
+            return
+        sub_format_path = latex_format_for(
+            template_path, CatalogWorkingSet.DOCUMENT_CLASS, self.latex_options, self.log)
+        documents = [document]
+        for sub_project, (project_dir, latex_file) in zip(self.sub_projects, self.sub_catalog_latex):
+            if sub_project.name in self.unchanged_sub_projects:
+                continue
             self.log.info(f'Generating sub catalog PDF from: {latex_file}')
             target_path = project_dir / latex_file.with_suffix('.pdf').name
-            tex_path = self.intermediate_path / latex_file.name
-            create_pdf_from_latex(tex_path, target_path, self.log)
+            documents.append(LatexDocument(self.intermediate_path / latex_file.name, target_path, sub_format_path))
+        create_pdfs_from_latex(documents, self.log, self.jobs, self.latex_options)
+
+    def slice_sub_catalog_pdfs(self, document: LatexDocument):
+        """
+        Extract the sub catalogs from the pages of the compiled super catalog.
+
+        The chapter of each sub project records its first and last page in the auxiliary files.
+
+        :param document: The compiled super catalog.
+        """
+        page_marks = document.read_page_marks()
+        for sub_project, (project_dir, latex_file) in zip(self.sub_projects, self.sub_catalog_latex):
+            first_page = page_marks.get(f'{sub_project.name}-start')
+            last_page = page_marks.get(f'{sub_project.name}-end')
+            if first_page is None or last_page is None:
+                raise ScriptError(f'Missing the page marks for the sub project: {sub_project.name}')
+            target_path = project_dir / latex_file.with_suffix('.pdf').name
+            self.log.info(f'Extracting pages {first_page}-{last_page} of the super catalog to: {target_path}')
+            extract_pdf_pages(document.pdf_path, first_page, last_page, target_path)
+
+    def write_sub_project_manifests(self):
+        """
+        Write the manifests of the sub projects, after their chapters and sub catalogs were built.
+        """
+        for sub_project, (project_dir, latex_file) in zip(self.sub_projects, self.sub_catalog_latex):
+            manifest = self.sub_project_manifests[sub_project.name]
+            manifest.add_fingerprint(self.intermediate_path / f'{sub_project.name}-chapter.tex')
+            manifest.add_fingerprint(self.intermediate_path / f'{sub_project.name}-body.tex')
+            if not self.slice_sub_catalogs:
+                manifest.add_fingerprint(project_dir / latex_file.with_suffix('.pdf').name)
+            manifest.path.parent.mkdir(parents=True, exist_ok=True)
+            manifest.save()
 
     def run(self):
         try:
             self.parse_arguments()
             self.init_logging()
             self.read_configuration()
-            self.compress_images()
+            self.init_image_store()
             self.process_subprojects()
+            self.compress_images()
             self.generate_pdf()
+            self.write_sub_project_manifests()
         except ScriptError as err:
             if self.log:
                 self.log.error(err)
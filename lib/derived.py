@@ -0,0 +1,169 @@
+import ast
+from array import array
+from decimal import Decimal
+from types import CodeType
+from typing import Optional
+
+from .exceptions import ScriptError
+from .model import ModelTable
+
+try:
+    import numpy
+except ImportError:  # NumPy is only required for the vectorized evaluation of derived parameters.
+    numpy = None
+
+
+# Integer columns are only vectorized if all values are in this range, see `_evaluate_columns`.
+VECTORIZE_INT_LIMIT = 2 ** 31
+# The nodes allowed in a vectorized expression. These operators give the same results for NumPy columns
+# as for single values. Functions like `round` or `max`, comparisons and powers do not, as NumPy uses its
+# own implementation of `pow`, which can differ in the last bit.
+VECTORIZE_NODES = (
+    ast.Expression, ast.BinOp, ast.UnaryOp, ast.Constant, ast.Subscript, ast.Name, ast.Load,
+    ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.UAdd, ast.USub,
+)
+
+
+class _NotVectorizable(Exception):
+    pass
+
+
+class _Columns(dict):
+    """
+    The values of a model table as NumPy columns, created on first access.
+    """
+
+    def __init__(self, table: ModelTable, as_float: bool = False):
+        super().__init__()
+        self._table = table
+        self._as_float = as_float
+
+    def __missing__(self, name: str):
+        column = self._table.column(name)
+        # Only typed columns are vectorized. Other columns have mixed types or text, and the results
+        # could differ from the single values.
+        if not isinstance(column, array) or column.typecode not in 'dq':
+            raise _NotVectorizable()
+        if column.typecode == 'd':
+            result = numpy.array(column, dtype=numpy.float64)
+        else:
+            result = numpy.array(column, dtype=numpy.int64)
+            if len(result) and (result.min() <= -VECTORIZE_INT_LIMIT or result.max() >= VECTORIZE_INT_LIMIT):
+                raise _NotVectorizable()
+            if self._as_float:
+                result = result.astype(numpy.float64)
+        self[name] = result
+        return result
+
+
+def is_vectorizable(expression: str) -> bool:
+    """
+    Test if an expression can be evaluated for whole columns with the same results as for single values.
+
+    Only arithmetic with numbers and `values['<name>']` is accepted.
+
+    :param expression: The Python expression.
+    :return: `True` if the expression can be vectorized.
+    """
+    try:
+        tree = ast.parse(expression, mode='eval')
+    except SyntaxError:
+        return False
+    value_names = set()
+    for node in ast.walk(tree):
+        if not isinstance(node, VECTORIZE_NODES):
+            return False
+        if isinstance(node, ast.Subscript):
+            if not (isinstance(node.value, ast.Name) and isinstance(node.slice, ast.Constant)
+                    and isinstance(node.slice.value, str)):
+                return False
+            value_names.add(id(node.slice))
+        elif isinstance(node, ast.Name) and node.id != 'values':
+            return False
+        elif isinstance(node, ast.Constant) and id(node) not in value_names:
+            if isinstance(node.value, bool) or not isinstance(node.value, (int, float)):
+                return False
+    return True
+
+
+class DerivedEvaluator:
+    """
+    Evaluates the derived parameters for all models of a table.
+
+    In vectorized mode, each expression is evaluated once for NumPy columns with the values of all models.
+    Only expressions that give identical results are vectorized, all others are evaluated for each model.
+    The columns are kept, so they are only created once for all derived parameters.
+    """
+
+    def __init__(self, table: ModelTable, vectorize: bool = False):
+        """
+        Create a new evaluator.
+
+        :param table: The models. The results are stored as new columns of the table.
+        :param vectorize: Evaluate the expressions for whole columns if possible, which requires NumPy.
+        """
+        if vectorize and numpy is None:
+            raise ScriptError('The vectorized evaluation of derived parameters requires the NumPy package.')
+        self.table = table
+        self.vectorize = vectorize
+        self._columns: Optional[_Columns] = None
+        self._float_columns: Optional[_Columns] = None
+        if vectorize:
+            self._columns = _Columns(table)
+            self._float_columns = _Columns(table, as_float=True)
+
+    def _evaluate_columns(self, code: CodeType) -> Optional['numpy.ndarray']:
+        """
+        Evaluate an expression once for the NumPy columns.
+
+        :return: The values for all rows, or `None` if the expression has to be evaluated for each row.
+        """
+        try:
+            # Errors like a division by zero are raised, so the evaluation for each row reports them as before.
+            with numpy.errstate(all='raise'):
+                result = eval(code, {'values': self._columns})
+                if isinstance(result, numpy.ndarray) and result.dtype.kind == 'i':
+                    # NumPy integers silently wrap around. Evaluate the expression with floats again, to make
+                    # sure the exact results fit into the 64-bit integers.
+                    magnitude = eval(code, {'values': self._float_columns})
+                    if numpy.abs(magnitude).max() >= VECTORIZE_INT_LIMIT:
+                        return None
+        except (_NotVectorizable, LookupError, ArithmeticError, FloatingPointError, TypeError, ValueError):
+            return None
+        if not isinstance(result, numpy.ndarray) or result.shape != (len(self.table),):
+            return None
+        if result.dtype.kind not in 'if':
+            return None
+        return result
+
+    def evaluate(self, code: CodeType, expression: str, name: str):
+        """
+        Evaluate a derived parameter for all rows.
+
+        :param code: The compiled expression.
+        :param expression: The source of the expression.
+        :param name: The name of the derived parameter.
+        """
+        if self.vectorize and len(self.table) and is_vectorizable(expression):
+            result = self._evaluate_columns(code)
+            if result is not None:
+                if result.dtype.kind == 'f':
+                    column = array('d', result.astype(numpy.float64).tobytes())
+                else:
+                    column = array('q', result.astype(numpy.int64).tobytes())
+                self.table.set_values(name, column)
+                # Later expressions can use the result as column.
+                self._columns[name] = result
+                self._float_columns[name] = result.astype(numpy.float64)
+                return
+        results = []
+        for index, row in enumerate(self.table.value_rows()):
+            try:
+                results.append(eval(code, {'values': row}))
+            except TypeError as err:
+                message = f'The derived parameter `{name}` cannot be evaluated for model ' \
+                          f'`{self.table.part_ids[index]}`: {err}'
+                if any(isinstance(value, Decimal) for value in row.values()):
+                    message += '. Values with the type `decimal` can only be combined with integers and decimals.'
+                raise ScriptError(message)
+        self.table.set_values(name, results)
@@ -0,0 +1,487 @@
+import hashlib
+import json
+import logging
+import math
+import os
+import shutil
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Optional
+
+from .exceptions import ScriptError
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow is only required for the `pillow` backend.
+    Image = None
+
+
+IMAGE_BACKENDS = ('convert', 'convert-batch', 'pillow')
+
+# The width of the embedded images in the PDF in millimeters, by the place where they are used.
+# The text area of the A4 pages is 185 mm wide, the two column layouts have a column width of about 90.7 mm.
+IMAGE_USAGE_WIDTH_MM = {
+    'title': 185.0,  # The title page and the title image of a chapter.
+    'drawing': 185.0,  # The full-width dimension drawing.
+    'model': 90.7,  # An image in the two column model grid.
+    'overview': 90.7,  # A tile in the two column overview of the super catalog.
+}
+
+DEFAULT_IMAGE_DPI = 150
+
+
+def image_width_for_usage(usage: str, dpi: int) -> int:
+    """
+    Get the width in pixels for an image, from the place it is used in the document.
+
+    :param usage: The usage, one of the keys in `IMAGE_USAGE_WIDTH_MM`.
+    :param dpi: The resolution of the embedded images in dots per inch.
+    :return: The width in pixels.
+    """
+    return math.ceil(IMAGE_USAGE_WIDTH_MM[usage] / 25.4 * dpi)
+
+
+def default_job_count() -> int:
+    """
+    Get the number of CPU cores available to this process.
+
+    :return: The number of usable cores, at least one.
+    """
+    try:
+        return max(1, len(os.sched_getaffinity(0)))
+    except AttributeError:  # `sched_getaffinity` is not available on all platforms.
+        return os.cpu_count() or 1
+
+
+class ImageConversion:
+    """
+    A single image that is converted into a compressed JPEG.
+    """
+
+    def __init__(self, source_path: Path, target_path: Path, width: int):
+        """
+        Create a new image conversion.
+
+        :param source_path: The path of the original image.
+        :param target_path: The path of the compressed image.
+        :param width: The maximum width of the compressed image in pixels.
+        """
+        self.source_path = source_path
+        self.target_path = target_path
+        self.width = width
+        self.cache_path: Optional[Path] = None  # The path of the converted image in the cache.
+        self.error: str = ''  # The error message, if the conversion failed.
+
+
+class ImageJobPlan:
+    """
+    Plans the conversions for all requested images.
+
+    Every source image is converted only once, no matter how often it is requested. Each conversion gets
+    a unique target name, so images with the same name but a different suffix or location do not overwrite
+    each other.
+    """
+
+    def __init__(self, target_dir: Path):
+        """
+        Create a new, empty plan.
+
+        :param target_dir: The directory for the compressed images.
+        """
+        self.target_dir = target_dir
+        self._conversions: dict[str, ImageConversion] = {}  # image key -> conversion
+        self._target_names: set[str] = set()  # lower case, to be safe on case-insensitive file systems.
+
+    def _unique_target_name(self, source_path: Path) -> str:
+        """
+        Find a target name that is not used by another conversion.
+        """
+        candidates = [
+            f'{source_path.stem}.jpg',
+            f'{source_path.stem}-{source_path.suffix[1:]}.jpg',
+        ]
+        for candidate in candidates:
+            if candidate.lower() not in self._target_names:
+                return candidate
+        digest = hashlib.sha256(str(source_path).encode('utf-8')).hexdigest()
+        for length in range(8, len(digest) + 1):
+            candidate = f'{source_path.stem}-{digest[:length]}.jpg'
+            if candidate.lower() not in self._target_names:
+                return candidate
+        raise ScriptError(f'Could not find a unique name for image `{source_path}`.')
+
+    def _key(self, source_path: Path) -> str:
+        """
+        Get the key that identifies identical images.
+        """
+        return str(source_path.resolve())
+
+    def add(self, source_path: Path, width: int) -> ImageConversion:
+        """
+        Request the conversion of an image.
+
+        If an image is requested multiple times, it is converted to the largest requested width.
+
+        :param source_path: The path of the original image.
+        :param width: The maximum width of the compressed image in pixels.
+        :return: The conversion for this image, which is shared by all requests for the same image.
+        """
+        key = self._key(source_path)
+        conversion = self._conversions.get(key)
+        if conversion is None:
+            target_name = self._unique_target_name(source_path)
+            self._target_names.add(target_name.lower())
+            conversion = ImageConversion(source_path, self.target_dir / target_name, width)
+            self._conversions[key] = conversion
+        else:
+            conversion.width = max(conversion.width, width)
+        return conversion
+
+    @property
+    def conversions(self) -> list[ImageConversion]:
+        """
+        All planned conversions, in the order they were first requested.
+        """
+        return list(self._conversions.values())
+
+
+class ImageCache:
+    """
+    A persistent, content-addressed cache for converted images.
+
+    Converted images are stored by a key that is built from the SHA-256 hash of the source image and the
+    conversion parameters. The hashes of the source images are remembered using their size and modification
+    time, so unchanged images are not read again on the next run.
+    """
+
+    INDEX_NAME = 'index.json'
+
+    def __init__(self, cache_dir: Path):
+        """
+        Create a new image cache.
+
+        :param cache_dir: The root directory of the cache.
+        """
+        self.path = cache_dir / 'images'
+        self._lock = threading.Lock()
+        self._index: dict[str, list] = {}  # resolved path -> [size, mtime_ns, digest]
+        self._index_changed = False
+        index_path = self.path / self.INDEX_NAME
+        if index_path.is_file():
+            try:
+                self._index = json.loads(index_path.read_text(encoding='utf-8'))
+            except ValueError:
+                self._index = {}  # Ignore a damaged index, it is rebuilt from the images.
+
+    def content_hash(self, path: Path) -> str:
+        """
+        Get the SHA-256 hash of a source image.
+
+        :param path: The path to the image.
+        :return: The hash as hex string.
+        """
+        stat = path.stat()
+        index_key = str(path.resolve())
+        with self._lock:
+            entry = self._index.get(index_key)
+        if entry and entry[0] == stat.st_size and entry[1] == stat.st_mtime_ns:
+            return entry[2]
+        digest = hashlib.sha256()
+        with path.open('rb') as file:
+            for chunk in iter(lambda: file.read(1 << 20), b''):
+                digest.update(chunk)
+        result = digest.hexdigest()
+        with self._lock:
+            self._index[index_key] = [stat.st_size, stat.st_mtime_ns, result]
+            self._index_changed = True
+        return result
+
+    def path_for(self, source_path: Path, parameters: str) -> Path:
+        """
+        Get the cache path for a converted image.
+
+        :param source_path: The path of the original image.
+        :param parameters: All conversion parameters that influence the result.
+        :return: The path of the converted image in the cache.
+        """
+        key = hashlib.sha256(f'{self.content_hash(source_path)}:{parameters}'.encode('utf-8')).hexdigest()
+        return self.path / key[:2] / f'{key}.jpg'
+
+    def save(self):
+        """
+        Write the source image index to disk.
+        """
+        with self._lock:
+            if not self._index_changed:
+                return
+            self.path.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path / f'{self.INDEX_NAME}.tmp'
+            tmp_path.write_text(json.dumps(self._index), encoding='utf-8')
+            tmp_path.replace(self.path / self.INDEX_NAME)
+            self._index_changed = False
+
+
+class ImageStore(ImageJobPlan):
+    """
+    An image job plan that identifies images by their content.
+
+    A store can be shared by multiple working sets, e.g. by all sub projects of a super catalog. Identical
+    images from different projects are converted only once, and all working sets reference the same
+    compressed image.
+    """
+
+    def __init__(self, target_dir: Path, cache: ImageCache):
+        """
+        Create a new, empty image store.
+
+        :param target_dir: The directory for the compressed images.
+        :param cache: The image cache, used to get the content hashes of the images.
+        """
+        super().__init__(target_dir)
+        self.cache = cache
+
+    def _key(self, source_path: Path) -> str:
+        try:
+            return self.cache.content_hash(source_path)
+        except OSError as err:
+            raise ScriptError(f'Could not read image `{source_path}`: {err}')
+
+
+def _link_or_copy(source_path: Path, target_path: Path):
+    """
+    Place a file at the target path, using a hard link if possible.
+    """
+    target_path.unlink(missing_ok=True)
+    try:
+        os.link(source_path, target_path)
+    except OSError:
+        shutil.copyfile(source_path, target_path)
+
+
+class ImageConverter:
+    """
+    Converts images into compressed JPEGs, using a bounded pool of workers and the image cache.
+
+    There are three backends: `convert` runs one ImageMagick process per image, `convert-batch` runs
+    one ImageMagick process for a whole chunk of images, and `pillow` decodes and encodes the images
+    in-process. For JPEG sources, the `pillow` backend lets the decoder downscale the image while loading
+    it, so the full resolution image is never decoded.
+    """
+
+    def __init__(self, cache: ImageCache, jobs: int, log: logging.Logger, backend: str = 'convert',
+                 quality: int = 50, batch_size: int = 32):
+        """
+        Create a new image converter.
+
+        :param cache: The cache for the converted images.
+        :param jobs: The maximum number of concurrent conversions.
+        :param log: The logger for progress messages.
+        :param backend: The backend used for the conversion, one of `IMAGE_BACKENDS`.
+        :param quality: The JPEG quality.
+        :param batch_size: The maximum number of images per ImageMagick process for the `convert-batch` backend.
+        """
+        if backend not in IMAGE_BACKENDS:
+            raise ScriptError(f'Unknown image backend `{backend}`.')
+        if backend == 'pillow' and Image is None:
+            raise ScriptError('The `pillow` image backend requires the Pillow package.')
+        self.cache = cache
+        self.jobs = max(1, jobs)
+        self.log = log
+        self.backend = backend
+        self.quality = quality
+        self.batch_size = max(1, batch_size)
+
+    def parameters(self, conversion: ImageConversion) -> str:
+        """
+        Get all conversion parameters that influence the result, as used for the cache key.
+        """
+        # Both ImageMagick backends run the same operations and create identical images.
+        backend = 'convert' if self.backend == 'convert-batch' else self.backend
+        return f'{backend}:quality={self.quality}:width={conversion.width}'
+
+    @staticmethod
+    def _geometry(width: int) -> str:
+        """
+        Get the ImageMagick geometry that shrinks an image to the given width, but never enlarges it.
+        """
+        return f'{width}x>'
+
+    @staticmethod
+    def _run_imagemagick(args: list[str]) -> str:
+        """
+        Run ImageMagick with the given arguments.
+
+        :return: An error message, or an empty string on success.
+        """
+        try:
+            result = subprocess.run(['convert'] + args, capture_output=True)
+        except OSError as err:
+            return str(err)
+        if result.returncode != 0:
+            error = result.stderr.decode('utf-8', errors='replace').strip()
+            return error if error else f'`convert` failed with exit code {result.returncode}'
+        return ''
+
+    def _run_convert(self, source_path: Path, target_path: Path, width: int) -> str:
+        """
+        Convert a single image using ImageMagick.
+
+        :return: An error message, or an empty string on success.
+        """
+        args = [
+            '-quality', str(self.quality),
+            '-resize', self._geometry(width),
+            str(source_path),
+            str(target_path)
+        ]
+        return self._run_imagemagick(args)
+
+    def _run_convert_batch(self, jobs: list[tuple[Path, Path, int]]) -> str:
+        """
+        Convert a chunk of images using a single ImageMagick process.
+
+        Each image is read, resized and written, then removed from the image sequence before the next
+        image is read. So only one image is held in memory at a time.
+
+        :param jobs: A list of source paths, target paths and widths.
+        :return: An error message, or an empty string on success.
+        """
+        args = ['-quality', str(self.quality)]
+        for index, (source_path, target_path, width) in enumerate(jobs):
+            args.extend([str(source_path), '-resize', self._geometry(width)])
+            if index < len(jobs) - 1:
+                args.extend(['-write', str(target_path), '+delete'])
+            else:
+                args.append(str(target_path))  # The last image is the regular output of the command.
+        return self._run_imagemagick(args)
+
+    def _run_pillow(self, source_path: Path, target_path: Path, width: int) -> str:
+        """
+        Convert a single image in-process using Pillow.
+
+        Like the ImageMagick backends, wider images are scaled down to the given width, keeping their
+        aspect ratio. Transparent areas are placed on a white background.
+
+        :return: An error message, or an empty string on success.
+        """
+        try:
+            with Image.open(source_path) as image:
+                if image.width > width:
+                    # For JPEG images, this selects the smallest DCT scale that is still larger than the target.
+                    image.draft('RGB', (width, math.ceil(image.height * width / image.width)))
+                if image.mode in ('RGBA', 'LA', 'P'):
+                    image = image.convert('RGBA')
+                    background = Image.new('RGB', image.size, (255, 255, 255))
+                    background.paste(image, mask=image.getchannel('A'))
+                    image = background
+                elif image.mode != 'RGB':
+                    image = image.convert('RGB')
+                if image.width > width:
+                    new_size = (width, max(1, round(image.height * width / image.width)))
+                    image = image.resize(new_size, Image.Resampling.LANCZOS)
+                image.save(target_path, 'JPEG', quality=self.quality)
+        except (OSError, ValueError) as err:
+            return str(err)
+        return ''
+
+    @staticmethod
+    def _tmp_path(conversion: ImageConversion) -> Path:
+        """
+        Get a unique temporary path next to the cache entry.
+
+        Images are written into a temporary file first, so an interrupted run never leaves a broken entry.
+        """
+        return conversion.cache_path.with_name(f'{conversion.cache_path.stem}-{threading.get_ident()}.tmp.jpg')
+
+    def _store(self, conversion: ImageConversion, tmp_path: Path):
+        """
+        Move a converted image into the cache and place it at the target path.
+        """
+        tmp_path.replace(conversion.cache_path)
+        _link_or_copy(conversion.cache_path, conversion.target_path)
+
+    def _prepare(self, conversion: ImageConversion) -> bool:
+        """
+        Look up a conversion in the cache and use the cached image if there is one.
+
+        :return: `True` if the conversion is done, `False` if the image has to be converted.
+        """
+        try:
+            conversion.cache_path = self.cache.path_for(conversion.source_path, self.parameters(conversion))
+        except OSError as err:
+            conversion.error = str(err)
+            return True
+        if conversion.cache_path.is_file():
+            _link_or_copy(conversion.cache_path, conversion.target_path)
+            return True
+        conversion.cache_path.parent.mkdir(parents=True, exist_ok=True)
+        return False
+
+    def _convert(self, conversion: ImageConversion):
+        """
+        Convert a single image.
+        """
+        self.log.info(f'Converting: {conversion.source_path.name} => {conversion.target_path.name}...')
+        tmp_path = self._tmp_path(conversion)
+        if self.backend == 'pillow':
+            conversion.error = self._run_pillow(conversion.source_path, tmp_path, conversion.width)
+        else:
+            conversion.error = self._run_convert(conversion.source_path, tmp_path, conversion.width)
+        if conversion.error:
+            tmp_path.unlink(missing_ok=True)
+            return
+        self._store(conversion, tmp_path)
+
+    def _convert_batch(self, conversions: list[ImageConversion]):
+        """
+        Convert a chunk of images with a single ImageMagick process.
+
+        If the process fails, the images without a result are converted one by one again, so each error
+        is reported for the image that caused it.
+        """
+        self.log.info(f'Converting {len(conversions)} images: {conversions[0].source_path.name}, ...')
+        tmp_paths = list([self._tmp_path(c) for c in conversions])
+        error = self._run_convert_batch(
+            list([(c.source_path, p, c.width) for c, p in zip(conversions, tmp_paths)]))
+        for conversion, tmp_path in zip(conversions, tmp_paths):
+            if not error and tmp_path.is_file():
+                self._store(conversion, tmp_path)
+            else:
+                tmp_path.unlink(missing_ok=True)
+                self._convert(conversion)
+
+    def _chunks(self, conversions: list[ImageConversion]) -> list[list[ImageConversion]]:
+        """
+        Split the conversions into chunks for the `convert-batch` backend.
+
+        The chunks are made smaller than the batch size if necessary, so all workers get some work.
+        """
+        chunk_size = min(self.batch_size, -(-len(conversions) // self.jobs))
+        return list([conversions[i:i + chunk_size] for i in range(0, len(conversions), chunk_size)])
+
+    def convert(self, conversions: list[ImageConversion]):
+        """
+        Convert images concurrently.
+
+        All conversions are run, even if some of them fail. Failures are collected and reported
+        together after the last conversion has finished.
+
+        :param conversions: The conversions to run.
+        """
+        if not conversions:
+            return
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            is_done = list(executor.map(self._prepare, conversions))
+            pending = list([c for c, done in zip(conversions, is_done) if not done])
+            if pending and self.backend == 'convert-batch':
+                list(executor.map(self._convert_batch, self._chunks(pending)))
+            else:
+                list(executor.map(self._convert, pending))
+        self.cache.save()
+        failed = [c for c in conversions if c.error]
+        if failed:
+            for conversion in failed:
+                self.log.error(f'Failed to convert `{conversion.source_path}`: {conversion.error}')
+            raise ScriptError(f'Failed to convert {len(failed)} of {len(conversions)} images.')
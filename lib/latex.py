@@ -1,23 +1,60 @@
+import functools
+import hashlib
 import logging
 import re
 import shutil
 import subprocess
-from pathlib import Path
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path, PurePath
+from typing import Optional, Union
 
-from jinja2 import Environment, FileSystemLoader
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
 
 from .exceptions import ScriptError
 
 
-RE_LATEX_ESCAPE = [
-    (re.compile(r'\\'), r'\\textbackslash'),
-    (re.compile(r'([{}_#%&$])'), r'\\\1'),
-    (re.compile(r'~'), r'\~{}'),
-    (re.compile(r'\^'), r'\^{}'),
-    (re.compile(r'"'), r"''"),
-    (re.compile(r'\.\.\.+'), r'\\ldots'),
-    (re.compile(r'/'), r'\/')
-]
+# All characters and sequences that are escaped in a single pass, with their replacements.
+RE_LATEX_ESCAPE = re.compile(r'[\\{}_#%&$~^"/]|\.\.\.+')
+LATEX_ESCAPE_REPLACEMENTS = {
+    '\\': r'\textbackslash',
+    '{': r'\{',
+    '}': r'\}',
+    '_': r'\_',
+    '#': r'\#',
+    '%': r'\%',
+    '&': r'\&',
+    '$': r'\$',
+    '~': r'\~{}',
+    '^': r'\^{}',
+    '"': "''",
+    '/': r'\/',
+}
+# The number of escaped values that are remembered. Table cells repeat the same few values very often.
+LATEX_ESCAPE_CACHE_SIZE = 8192
+
+# The auxiliary files that carry state from one LaTeX pass to the next.
+LATEX_STATE_SUFFIXES = ('.aux', '.toc', '.out')
+# Included chapters, referenced from the main `.aux` file.
+RE_LATEX_AUX_INPUT = re.compile(rb'\\@input\{([^}]+\.aux)\}')
+# Messages of LaTeX and packages that request another run. Case-sensitive, to skip `rerunfilecheck.sty`.
+RE_LATEX_RERUN = re.compile(rb'Rerun|Please rerun')
+# Page marks written by `\\catalogpagemark` in the templates.
+RE_LATEX_PAGE_MARK = re.compile(rb'\\catalogpage\{([^}]*)\}\{(\d+)\}')
+
+DEFAULT_LATEX_MAX_PASSES = 5
+# The number of template output fragments that are joined before writing them to the file.
+LATEX_STREAM_BUFFER_SIZE = 64
+
+
+def _escape_latex_match(match: re.Match) -> str:
+    return LATEX_ESCAPE_REPLACEMENTS.get(match.group(), r'\ldots')
+
+
+@functools.lru_cache(maxsize=LATEX_ESCAPE_CACHE_SIZE)
+def _escape_latex_text(value: str) -> str:
+    return RE_LATEX_ESCAPE.sub(_escape_latex_match, value)
 
 
 def escape_latex(value: str) -> str:
@@ -27,21 +64,30 @@ def escape_latex(value: str) -> str:
     :param value: The original text
     :return: The escaped text.
     """
-    value = str(value)
-    for regexp, replacement in RE_LATEX_ESCAPE:
-        value = regexp.sub(replacement, value)
-    return value
+    return _escape_latex_text(str(value))
 
 
-def render_latex_template(template_path: Path, template_name: str, parameters: dict) -> str:
+def image_path(path: Union[str, PurePath]) -> str:
     """
-    Render a LaTeX template.
+    Format the path of an image for LaTeX.
 
-    :param template_path: The path to the template dir.
-    :param template_name: The name of the template.
-    :param parameters: A dictionary with globals to use.
-    :return: The rendered text.
+    The image paths are used as file names and as part of control sequence names,
+    so they always use forward slashes.
+
+    :param path: The path of the image, relative to the LaTeX document.
+    :return: The formatted path.
     """
+    return PurePath(path).as_posix()
+
+
+@functools.lru_cache(maxsize=None)
+def _template_environment(template_path: Path, for_latex: bool) -> Environment:
+    if not for_latex:
+        return Environment(
+            loader=FileSystemLoader(template_path),
+            autoescape=False,
+            bytecode_cache=FileSystemBytecodeCache(pattern='__jinja2_%s.cache'),
+        )
     env = Environment(  # for LaTeX
         loader=FileSystemLoader(template_path),
         autoescape=False,
@@ -51,46 +97,352 @@ def render_latex_template(template_path: Path, template_name: str, parameters: d
         block_end_string='}',
         line_statement_prefix='%%',
         line_comment_prefix='%#',
+        comment_start_string='\\#{',  # The default `{#` is common in LaTeX macro definitions.
+        comment_end_string='}',
         trim_blocks=True,
+        # The compiled templates depend on the syntax, so they are kept apart from the default environment.
+        bytecode_cache=FileSystemBytecodeCache(pattern='__jinja2_latex_%s.cache'),
     )
     env.filters['escape_latex'] = escape_latex
-    for key, value in parameters.items():
-        env.globals[key] = value
-    template = env.get_template(template_name)
-    return template.render()
+    env.filters['image_path'] = image_path
+    return env
+
+
+def template_environment(template_path: Path, for_latex: bool = True) -> Environment:
+    """
+    Get the shared template environment for a template directory.
+
+    There is one environment per directory, so each template is compiled only once per run. The compiled
+    templates are also kept in a bytecode cache on disk, which is reused by the next runs.
+
+    :param template_path: The path to the template dir.
+    :param for_latex: If the environment uses the LaTeX compatible syntax and filters.
+    :return: The environment.
+    """
+    return _template_environment(template_path.resolve(), for_latex)
+
+
+def render_latex_template(template_path: Path, template_name: str, parameters: dict) -> str:
+    """
+    Render a LaTeX template.
+
+    :param template_path: The path to the template dir.
+    :param template_name: The name of the template.
+    :param parameters: A dictionary with the variables for the template.
+    :return: The rendered text.
+    """
+    template = template_environment(template_path).get_template(template_name)
+    return template.render(parameters)
 
 
 def write_latex_template(template_path: Path, template_name: str, parameters: dict, output_path: Path):
     """
     Writes the rendered LaTeX into a file.
 
+    The output is streamed into the file while the template is rendered, so the document is never
+    held in memory as a whole.
+
     :param template_path: The path to the template dir.
     :param template_name: The name of the template.
-    :param parameters: A dictionary with globals to use.
+    :param parameters: A dictionary with the variables for the template.
     :param output_path: The output path to write.
     """
-    text = render_latex_template(template_path, template_name, parameters)
-    output_path.write_text(text, encoding='utf-8')
+    template = template_environment(template_path).get_template(template_name)
+    stream = template.stream(parameters)
+    stream.enable_buffering(LATEX_STREAM_BUFFER_SIZE)
+    with output_path.open('w', encoding='utf-8', buffering=1 << 16) as file:
+        stream.dump(file)
+
+
+def _latex_state(working_dir: Path, job_name: str) -> dict[str, bytes]:
+    """
+    Read the auxiliary files of a LaTeX document, that carry state from one pass to the next.
 
+    This includes the `.aux` files of all chapters that are included into the document.
 
-def create_pdf_from_latex(tex_path: Path, pdf_path: Path, log: logging.Logger):
+    :param working_dir: The directory where LaTeX writes the auxiliary files.
+    :param job_name: The name of the document, without suffix.
+    :return: A dictionary with the file names and contents of all existing files.
+    """
+    state: dict[str, bytes] = {}
+    names = list([f'{job_name}{suffix}' for suffix in LATEX_STATE_SUFFIXES])
+    while names:
+        name = names.pop(0)
+        path = working_dir / name
+        if name in state or not path.is_file():
+            continue
+        state[name] = path.read_bytes()
+        if name.endswith('.aux'):
+            names.extend(m.decode('utf-8') for m in RE_LATEX_AUX_INPUT.findall(state[name]))
+    return state
+
+
+def _restore_latex_state(state_path: Path, build_dir: Path) -> bool:
+    """
+    Copy the auxiliary files of a previous build into the build directory.
+
+    :param state_path: The directory with the auxiliary files of the document.
+    :param build_dir: The build directory of the document.
+    :return: `True` if any files were restored.
+    """
+    if not state_path.is_dir():
+        return False
+    restored = False
+    for path in state_path.rglob('*'):
+        if path.is_file():
+            target_path = build_dir / path.relative_to(state_path)
+            target_path.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copyfile(path, target_path)
+            restored = True
+    return restored
+
+
+def _save_latex_state(state: dict[str, bytes], state_path: Path):
+    """
+    Keep the auxiliary files of a build for the next build.
+
+    :param state: The auxiliary files, as returned from `_latex_state`.
+    :param state_path: The directory for the auxiliary files of the document.
+    """
+    shutil.rmtree(state_path, ignore_errors=True)
+    for name, data in state.items():
+        path = state_path / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+
+
+class LatexOptions:
+    """
+    Options for compiling LaTeX documents into PDFs.
+    """
+
+    def __init__(self):
+        self.max_passes: int = DEFAULT_LATEX_MAX_PASSES  # The maximum number of PDFLaTeX runs per document.
+        self.draft_mode: bool = False  # Run the intermediate passes with `-draftmode`.
+        self.format_dir: Optional[Path] = None  # If set, precompiled preamble formats are cached in this directory.
+        self.state_dir: Optional[Path] = None  # If set, the auxiliary files are kept in this directory between builds.
+
+
+class LatexDocument:
+    """
+    A LaTeX document to compile.
+    """
+
+    def __init__(self, tex_path: Path, pdf_path: Path, format_path: Optional[Path] = None):
+        """
+        Create a new document.
+
+        :param tex_path: The path to the latex file.
+        :param pdf_path: The path and location of the final PDF file.
+        :param format_path: The precompiled format with the preamble of the document, if the latex file
+            was written without preamble.
+        """
+        self.tex_path = tex_path
+        self.pdf_path = pdf_path
+        self.format_path = format_path
+        self.build_dir = tex_path.parent / 'build' / tex_path.stem  # The directory for the auxiliary files.
+
+    def read_page_marks(self) -> dict[str, int]:
+        """
+        Read the page marks of the compiled document.
+
+        The marks are written with `\\catalogpagemark{<name>}` and contain the absolute page number,
+        starting with one for the first page of the PDF.
+
+        :return: A dictionary with the names of the marks and their page numbers.
+        """
+        marks: dict[str, int] = {}
+        for data in _latex_state(self.build_dir, self.tex_path.stem).values():
+            for name, page in RE_LATEX_PAGE_MARK.findall(data):
+                marks[name.decode('utf-8')] = int(page)
+        return marks
+
+
+_format_lock = threading.Lock()
+
+
+@functools.lru_cache(maxsize=None)
+def _latex_version() -> str:
+    """
+    Get the version of PDFLaTeX, as formats only work with the exact version that created them.
+    """
+    try:
+        result = subprocess.run(['pdflatex', '--version'], capture_output=True)
+    except OSError as err:
+        raise ScriptError(f'Could not run PDFLaTeX: {err}')
+    return result.stdout.decode('utf-8', errors='replace').split('\n')[0]
+
+
+def build_latex_format(preamble: str, format_dir: Path, log: logging.Logger) -> Path:
+    """
+    Build a format with a precompiled preamble, or get it from the cache.
+
+    The format is keyed on the text of the preamble and the version of PDFLaTeX. Documents compiled with
+    this format must omit everything up to and including the preamble, and start after it.
+
+    :param preamble: The preamble, starting with `\\documentclass`, without `\\begin{document}`.
+    :param format_dir: The directory where formats are cached.
+    :param log: The logger for progress messages.
+    :return: The path to the format file.
+    """
+    with _format_lock:
+        key = hashlib.sha256(f'{_latex_version()}\n{preamble}'.encode('utf-8')).hexdigest()[:16]
+        job_name = f'preamble-{key}'
+        format_path = format_dir / f'{job_name}.fmt'
+        if format_path.is_file():
+            return format_path
+        log.info(f'Building LaTeX format for the preamble: {format_path.name} ...')
+        format_dir.mkdir(parents=True, exist_ok=True)
+        ini_path = format_dir / f'{job_name}.tex'
+        ini_path.write_text(f'{preamble}\n\\dump\n', encoding='utf-8')
+        args = [
+            'pdflatex',
+            '-ini',
+            '-halt-on-error',
+            '-interaction=nonstopmode',
+            f'-jobname={job_name}',
+            '&pdflatex',
+            ini_path.name,
+        ]
+        result = subprocess.run(args, cwd=format_dir, capture_output=True)
+        if result.returncode != 0 or not format_path.is_file():
+            raise ScriptError(f'Building the LaTeX format failed: {result.stdout}')
+        log.info('done building the LaTeX format.')
+        return format_path
+
+
+def latex_format_for(template_path: Path, document_class: str, options: LatexOptions,
+                     log: logging.Logger) -> Optional[Path]:
+    """
+    Get the precompiled format for the shared preamble in `latex/preamble.tex`.
+
+    :param template_path: The path to the template dir.
+    :param document_class: The document class used in the preamble.
+    :param options: The options for the build.
+    :param log: The logger for progress messages.
+    :return: The path to the format, or `None` if no precompiled preamble is used.
+    """
+    if not options.format_dir:
+        return None
+    preamble = render_latex_template(template_path, 'latex/preamble.tex', {'document_class': document_class})
+    return build_latex_format(preamble, options.format_dir, log)
+
+
+def _run_latex(args: list[str], working_dir: Path) -> tuple[bytes, float]:
+    """
+    Run PDFLaTeX once.
+
+    :return: The output of the run and the elapsed time in seconds.
+    """
+    start = time.perf_counter()
+    result = subprocess.run(args, cwd=working_dir, capture_output=True)
+    if result.returncode != 0:
+        raise ScriptError(f'LaTeX build failed: {result.stdout}')
+    return result.stdout, time.perf_counter() - start
+
+
+def create_pdf_from_latex(tex_path: Path, pdf_path: Path, log: logging.Logger,
+                          options: Optional[LatexOptions] = None, build_dir: Optional[Path] = None,
+                          format_path: Optional[Path] = None):
     """
     Compile the given latex file into a PDF.
 
+    PDFLaTeX is run until the auxiliary files reach a fixed point, and the log does not request
+    another run, or until the maximum number of passes is reached.
+
+    In draft mode, PDFLaTeX is run with `-draftmode` until the auxiliary files are stable. These passes
+    neither read the images nor write a PDF. Then a single final pass creates the PDF.
+
+    If a state directory is set in the options, the build starts with the auxiliary files of the previous
+    build of the document. For an unchanged document, a single pass is enough then.
+
     :param tex_path: The path to the latex file.
     :param pdf_path: The path and location of the final PDF file.
+    :param log: The logger for progress messages.
+    :param options: The options for the build, or `None` to use the defaults.
+    :param build_dir: An optional directory for the auxiliary files and the PDF, inside the directory
+        of the latex file. Documents with separate build directories can be compiled concurrently.
+    :param format_path: An optional precompiled format with the preamble of the document.
     """
+    if options is None:
+        options = LatexOptions()
     working_dir = tex_path.parent
     args = [
         'pdflatex',
         '-halt-on-error',
         '-interaction=nonstopmode',
-        str(tex_path.relative_to(working_dir)),
     ]
-    for i in range(3):
-        log.info(f'Running PDFLaTeX, iteration {i} ...')
-        result = subprocess.run(args, cwd=working_dir, capture_output=True)
-        if result.returncode != 0:
-            raise ScriptError(f'LaTeX build failed: {result.stdout}')
-    shutil.move(tex_path.with_suffix('.pdf'), pdf_path)
+    if build_dir:
+        build_dir.mkdir(parents=True, exist_ok=True)
+        args.append(f'-output-directory={build_dir.relative_to(working_dir).as_posix()}')
+    else:
+        build_dir = working_dir
+    if format_path:
+        args.append(f'-fmt={format_path.resolve().with_suffix("").as_posix()}')
+    tex_arg = str(tex_path.relative_to(working_dir))
+    state_path = options.state_dir / tex_path.stem if options.state_dir else None
+    # With restored auxiliary files, try to create the PDF with the first pass.
+    is_stable = state_path is not None and _restore_latex_state(state_path, build_dir)
+    if is_stable:
+        log.info(f'Restored the auxiliary files of {tex_path.name} from the previous build.')
+    state = _latex_state(build_dir, tex_path.stem)
+    passes = 0
+    draft_times: list[float] = []
+    full_times: list[float] = []
+    while True:
+        passes += 1
+        # The last allowed pass always creates the PDF.
+        is_draft = options.draft_mode and not is_stable and passes < options.max_passes
+        log.info(f'Running PDFLaTeX for {tex_path.name}, pass {passes}{" (draft)" if is_draft else ""} ...')
+        output, elapsed = _run_latex(args + (['-draftmode'] if is_draft else []) + [tex_arg], working_dir)
+        (draft_times if is_draft else full_times).append(elapsed)
+        new_state = _latex_state(build_dir, tex_path.stem)
+        output = output.replace(b'\n', b'')  # LaTeX wraps long lines of its output.
+        converged = new_state == state and not RE_LATEX_RERUN.search(output)
+        state = new_state
+        if not is_draft and (converged or passes >= options.max_passes):
+            break
+        is_stable = converged
+    if state_path:
+        _save_latex_state(state, state_path)
+    if converged:
+        log.info(f'{tex_path.name} needed {passes} PDFLaTeX passes.')
+    else:
+        log.warning(f'{tex_path.name} did not converge after {passes} PDFLaTeX passes, '
+                    f'cross-references may be wrong.')
+    if draft_times:
+        # Without draft mode, each draft pass would have been a full pass, and the final pass is not needed.
+        full_time = sum(full_times) / len(full_times)
+        saving = len(draft_times) * full_time - sum(draft_times) - sum(full_times)
+        log.info(f'{tex_path.name}: {len(draft_times)} draft passes took {sum(draft_times):.2f} s, '
+                 f'a full pass {full_time:.2f} s. Estimated saving of draft mode: {saving:.2f} s.')
+    shutil.move(build_dir / f'{tex_path.stem}.pdf', pdf_path)
 
+
+def create_pdfs_from_latex(documents: list[LatexDocument], log: logging.Logger, jobs: int,
+                           options: Optional[LatexOptions] = None):
+    """
+    Compile multiple latex files into PDFs concurrently.
+
+    Each document is compiled in its own build directory, so the auxiliary files of the documents do not
+    collide. All documents are compiled, even if some of them fail. Failures are reported together at the end.
+
+    :param documents: The documents to compile.
+    :param log: The logger for progress messages.
+    :param jobs: The maximum number of concurrent PDFLaTeX processes.
+    :param options: The options for the builds, or `None` to use the defaults.
+    """
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        futures = list([
+            executor.submit(create_pdf_from_latex, d.tex_path, d.pdf_path, log, options, d.build_dir,
+                            d.format_path)
+            for d in documents])
+    failed: list[LatexDocument] = []
+    for document, future in zip(documents, futures):
+        try:
+            future.result()
+        except ScriptError as err:
+            log.error(f'Failed to build `{document.tex_path.name}`: {err}')
+            failed.append(document)
+    if failed:
+        raise ScriptError(f'Failed to build {len(failed)} of {len(documents)} documents.')
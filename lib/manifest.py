@@ -0,0 +1,143 @@
+import hashlib
+import json
+from pathlib import Path
+from typing import Any, Optional
+
+
+def file_fingerprint(path: Path) -> list[int]:
+    """
+    Get a cheap fingerprint of a file, without reading it.
+
+    :param path: The path of the file.
+    :return: The size and the modification time in nanoseconds, or an empty list if the file is missing.
+    """
+    try:
+        stat = path.stat()
+    except OSError:
+        return []
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+class BuildManifest:
+    """
+    A record of all inputs of a build, to detect if a build can be skipped.
+
+    Small inputs, like the configuration, the templates and the generator itself, are recorded with the
+    SHA-256 hash of their contents. Large files, like the images and the output PDF, are recorded with
+    their size and modification time.
+    """
+
+    VERSION = 1
+
+    def __init__(self, path: Path):
+        """
+        Create a new, empty manifest.
+
+        :param path: The path of the manifest file.
+        """
+        self.path = path
+        self.inputs: dict[str, str] = {}  # input name -> SHA-256 hash
+        self.files: dict[str, list[int]] = {}  # path -> [size, mtime_ns]
+
+    def add_file(self, name: str, path: Path):
+        """
+        Record the contents of a small input file.
+
+        :param name: The name of the input in the manifest.
+        :param path: The path of the file.
+        """
+        if path.is_file():
+            self.inputs[name] = hashlib.sha256(path.read_bytes()).hexdigest()
+        else:
+            self.inputs[name] = ''
+
+    def add_files(self, prefix: str, root_dir: Path, pattern: str):
+        """
+        Record the contents of all files in a directory.
+
+        :param prefix: The prefix for the names of the inputs.
+        :param root_dir: The directory to scan.
+        :param pattern: The pattern for the files to record.
+        """
+        for path in sorted(root_dir.rglob(pattern)):
+            if path.is_file() and '__pycache__' not in path.parts:
+                self.add_file(f'{prefix}/{path.relative_to(root_dir).as_posix()}', path)
+
+    def add_value(self, name: str, value: Any):
+        """
+        Record an input value, like the command line options.
+
+        :param name: The name of the input in the manifest.
+        :param value: A value that can be serialized to JSON.
+        """
+        text = json.dumps(value, sort_keys=True, default=str)
+        self.inputs[name] = hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def add_fingerprint(self, path: Path):
+        """
+        Record the size and modification time of a large file.
+
+        :param path: The path of the file.
+        """
+        self.files[str(path.resolve())] = file_fingerprint(path)
+
+    def digest(self, *prefixes: str) -> str:
+        """
+        Get a combined hash of the recorded inputs.
+
+        :param prefixes: Only use the inputs with names starting with one of these prefixes.
+        :return: The SHA-256 hash as hex string.
+        """
+        digest = hashlib.sha256()
+        for name, value in sorted(self.inputs.items()):
+            if not prefixes or name.startswith(prefixes):
+                digest.update(f'{name}:{value}\n'.encode('utf-8'))
+        return digest.hexdigest()
+
+    def is_up_to_date(self, previous: Optional['BuildManifest']) -> bool:
+        """
+        Test if the inputs match the ones of a previous build.
+
+        The files recorded by the previous build are compared with their current state. This is sufficient,
+        because the set of referenced files is derived from inputs that are compared by their contents.
+
+        :param previous: The manifest of the previous build.
+        :return: `True` if nothing changed since the previous build.
+        """
+        if previous is None or previous.inputs != self.inputs:
+            return False
+        return all(file_fingerprint(Path(p)) == f for p, f in previous.files.items())
+
+    @classmethod
+    def load(cls, path: Path) -> Optional['BuildManifest']:
+        """
+        Load the manifest of a previous build.
+
+        :param path: The path of the manifest file.
+        :return: The manifest, or `None` if there is no valid manifest.
+        """
+        if not path.is_file():
+            return None
+        try:
+            data = json.loads(path.read_text(encoding='utf-8'))
+        except ValueError:
+            return None  # A damaged manifest just forces a new build.
+        if not isinstance(data, dict) or data.get('version') != cls.VERSION:
+            return None
+        manifest = cls(path)
+        manifest.inputs = data.get('inputs', {})
+        manifest.files = data.get('files', {})
+        return manifest
+
+    def save(self):
+        """
+        Write the manifest file.
+        """
+        data = {
+            'version': self.VERSION,
+            'inputs': self.inputs,
+            'files': self.files,
+        }
+        tmp_path = self.path.with_name(f'{self.path.name}.tmp')
+        tmp_path.write_text(json.dumps(data, indent=1, sort_keys=True), encoding='utf-8')
+        tmp_path.replace(self.path)
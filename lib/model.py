@@ -1,5 +1,7 @@
+from array import array
+from collections.abc import Iterable, Iterator, Mapping, Sequence
 from pathlib import Path
-from typing import Union, Literal, Any
+from typing import Literal, Any, Callable
 
 
 class Model:
@@ -14,8 +16,6 @@ class Model:
         self.original_values: dict[str, str] = original_values
         # runtime
         self.title: str = ''
-        self.values: dict[str, Union[int, float]] = {}
-        self.formatted_values: dict[str, str] = {}
 
     @staticmethod
     def from_data(data: dict[str, Any], data_format: Literal["json", "toml"], project_dir: Path) -> 'Model':
@@ -50,3 +50,325 @@ class Model:
             values['title'] = self.title
         return values
 
+
+class _Missing:
+    """
+    Marks a value that is missing in the data of a model. The class itself is the marker, so it keeps
+    its identity when a table is pickled.
+    """
+
+
+class CodedColumn(Sequence):
+    """
+    A column with few distinct values, like formatted values or text.
+
+    Every distinct value is stored once, the column itself only stores the index of the value
+    in the smallest possible integer array.
+    """
+
+    __slots__ = ('distinct', 'codes')
+
+    def __init__(self, distinct: list, codes: array):
+        self.distinct = distinct
+        self.codes = codes
+
+    @staticmethod
+    def from_values(values: Iterable) -> 'CodedColumn':
+        distinct: list = []
+        index_map: dict = {}
+        codes: list[int] = []
+        for value in values:
+            # The type is part of the key, so `1`, `1.0` and `True` are kept apart.
+            key = (type(value), value)
+            code = index_map.get(key)
+            if code is None:
+                code = index_map[key] = len(distinct)
+                distinct.append(value)
+            codes.append(code)
+        return CodedColumn(distinct, array(_code_typecode(len(distinct)), codes))
+
+    def take(self, indexes: Sequence[int]) -> 'CodedColumn':
+        codes = self.codes
+        return CodedColumn(self.distinct, array(codes.typecode, [codes[i] for i in indexes]))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list([self.distinct[c] for c in self.codes[index]])
+        return self.distinct[self.codes[index]]
+
+    def __iter__(self) -> Iterator:
+        distinct = self.distinct
+        return (distinct[c] for c in self.codes)
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+
+def _code_typecode(count: int) -> str:
+    if count <= 0x100:
+        return 'B'
+    if count <= 0x10000:
+        return 'H'
+    return 'L'
+
+
+def make_column(values: Iterable) -> Sequence:
+    """
+    Store the values of a column in the most compact form.
+
+    Columns with only `int` or only `float` values are stored in typed arrays. All other columns are
+    stored as `CodedColumn`, or as list if the values cannot be hashed.
+
+    :param values: The values of the column.
+    :return: A sequence that returns the same values.
+    """
+    if isinstance(values, (array, CodedColumn)):
+        return values
+    values = list(values)
+    value_types = set(map(type, values))
+    if value_types == {float}:
+        return array('d', values)
+    if value_types == {int}:
+        try:
+            return array('q', values)
+        except OverflowError:
+            pass  # Integers beyond 64 bit are kept as they are.
+    try:
+        return CodedColumn.from_values(values)
+    except TypeError:
+        return values
+
+
+def take_column(column: Sequence, indexes: Sequence[int]) -> Sequence:
+    if isinstance(column, CodedColumn):
+        return column.take(indexes)
+    if isinstance(column, array):
+        return array(column.typecode, [column[i] for i in indexes])
+    return list([column[i] for i in indexes])
+
+
+class RowValues(Mapping):
+    """
+    A read-only view on the values of a single row, that behaves like a dictionary.
+    """
+
+    __slots__ = ('_columns', '_index')
+
+    def __init__(self, columns: dict[str, Sequence], index: int):
+        self._columns = columns
+        self._index = index
+
+    def __getitem__(self, name: str):
+        value = self._columns[name][self._index]
+        if value is _Missing:
+            raise KeyError(name)
+        return value
+
+    def __iter__(self) -> Iterator[str]:
+        return (name for name, column in self._columns.items() if column[self._index] is not _Missing)
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+
+class ModelRow:
+    """
+    A view on a single model of a `ModelTable`, with the same attributes as `Model`.
+    """
+
+    __slots__ = ('table', 'index')
+
+    def __init__(self, table: 'ModelTable', index: int):
+        self.table = table
+        self.index = index
+
+    @property
+    def part_id(self) -> str:
+        return self.table.part_ids[self.index]
+
+    @property
+    def title(self) -> str:
+        return self.table.titles[self.index]
+
+    @property
+    def model_files(self) -> list[Path]:
+        return list(map(Path, self.table.model_files[self.index]))
+
+    @property
+    def image_files(self) -> list[Path]:
+        return list(map(Path, self.table.image_files[self.index]))
+
+    @property
+    def original_values(self) -> RowValues:
+        return RowValues(self.table.original_values, self.index)
+
+    @property
+    def values(self) -> RowValues:
+        return RowValues(self.table.values, self.index)
+
+    @property
+    def formatted_values(self) -> RowValues:
+        return RowValues(self.table.formatted_values, self.index)
+
+
+class ModelTable:
+    """
+    All models of a project, stored column by column.
+
+    Numeric columns are stored in typed arrays, and text columns like the formatted values store every
+    distinct text only once. Iterating the table yields `ModelRow` views, which can be used like `Model`
+    objects, so the templates work with single rows as before.
+    """
+
+    def __init__(self):
+        self.part_ids: list[str] = []
+        self.titles: Sequence[str] = []
+        # The paths are stored as text, as `Path` objects need several times the memory.
+        self.model_files: list[tuple[str, ...]] = []
+        self.image_files: list[tuple[str, ...]] = []
+        self.original_values: dict[str, Sequence] = {}  # parameter name -> column
+        self.values: dict[str, Sequence] = {}  # parameter name -> column
+        self.formatted_values: dict[str, Sequence[str]] = {}  # parameter name -> column
+
+    @staticmethod
+    def from_models(models: Iterable[Model]) -> 'ModelTable':
+        """
+        Create a table from single models.
+
+        :param models: The models, in the order of the rows.
+        :return: The new table.
+        """
+        table = ModelTable()
+        titles: list[str] = []
+        original_values: dict[str, list] = {}
+        for index, model in enumerate(models):
+            table.part_ids.append(model.part_id)
+            titles.append(model.title)
+            table.model_files.append(tuple(map(str, model.model_files)))
+            table.image_files.append(tuple(map(str, model.image_files)))
+            for name, value in model.original_values.items():
+                if name not in original_values:
+                    original_values[name] = [_Missing] * index
+                original_values[name].append(value)
+            for column in original_values.values():
+                if len(column) <= index:
+                    column.append(_Missing)
+        table.titles = make_column(titles)
+        table.original_values = dict((name, make_column(column)) for name, column in original_values.items())
+        return table
+
+    def original_column(self, name: str) -> Sequence:
+        """
+        Get the original values of a parameter.
+
+        :param name: The name of the parameter.
+        :return: The values of all rows.
+        :raises KeyError: If a model has no value for the parameter.
+        """
+        column = self.original_values.get(name)
+        if column is None or _Missing in (column.distinct if isinstance(column, CodedColumn) else column):
+            raise KeyError(name)
+        return column
+
+    def column(self, name: str) -> Sequence:
+        """
+        Get the processed values of a parameter.
+        """
+        return self.values[name]
+
+    def set_values(self, name: str, values: Iterable):
+        """
+        Set the processed values of a parameter for all rows.
+        """
+        column = make_column(values)
+        if len(column) != len(self):
+            raise ValueError(f'The column `{name}` has {len(column)} values for {len(self)} rows.')
+        self.values[name] = column
+
+    def set_formatted_values(self, name: str, texts: Iterable[str]):
+        """
+        Set the formatted values of a parameter for all rows.
+        """
+        column = CodedColumn.from_values(texts)
+        if len(column) != len(self):
+            raise ValueError(f'The column `{name}` has {len(column)} texts for {len(self)} rows.')
+        self.formatted_values[name] = column
+
+    def map_column(self, name: str, function: Callable[[Any], Any]) -> list:
+        """
+        Apply a function to the processed values of a parameter.
+
+        The function is called once for each distinct value, so it must only depend on the value.
+
+        :param name: The name of the parameter.
+        :param function: The function for a single value.
+        :return: The results for all rows.
+        """
+        results: dict = {}
+        mapped = []
+        for value in self.values[name]:
+            key = (type(value), value)
+            try:
+                result = results[key]
+            except KeyError:
+                result = results[key] = function(value)
+            except TypeError:
+                result = function(value)  # Values that cannot be hashed are not cached.
+            mapped.append(result)
+        return mapped
+
+    def value_rows(self) -> list[RowValues]:
+        """
+        Get a view on the processed values of each row.
+        """
+        return list([RowValues(self.values, index) for index in range(len(self))])
+
+    def sorted_indexes(self, names: list[str]) -> list[int]:
+        """
+        Get the row indexes, sorted by the values of the given parameters.
+
+        The sort is stable, rows with equal values keep their order.
+        """
+        keys = list(zip(*(self.values[name] for name in names)))
+        return sorted(range(len(self)), key=keys.__getitem__)
+
+    def group_indexes(self, names: list[str]) -> dict[tuple, list[int]]:
+        """
+        Group the rows by the values of the given parameters.
+
+        :param names: The names of the parameters.
+        :return: The row indexes for each combination of values, in the order of the rows.
+        """
+        groups: dict[tuple, list[int]] = {}
+        for index, key in enumerate(zip(*(self.values[name] for name in names))):
+            groups.setdefault(key, []).append(index)
+        return groups
+
+    def take(self, indexes: Sequence[int]) -> 'ModelTable':
+        """
+        Create a new table with the given rows.
+
+        :param indexes: The indexes of the rows, in the order of the new table.
+        :return: The new table.
+        """
+        table = ModelTable()
+        table.part_ids = take_column(self.part_ids, indexes)
+        table.titles = take_column(self.titles, indexes)
+        table.model_files = take_column(self.model_files, indexes)
+        table.image_files = take_column(self.image_files, indexes)
+        for source, target in ((self.original_values, table.original_values), (self.values, table.values),
+                               (self.formatted_values, table.formatted_values)):
+            for name, column in source.items():
+                target[name] = take_column(column, indexes)
+        return table
+
+    def __len__(self) -> int:
+        return len(self.part_ids)
+
+    def __getitem__(self, index: int) -> ModelRow:
+        if not -len(self) <= index < len(self):
+            raise IndexError(index)
+        return ModelRow(self, index % len(self))
+
+    def __iter__(self) -> Iterator[ModelRow]:
+        return (ModelRow(self, index) for index in range(len(self)))
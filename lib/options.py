@@ -0,0 +1,101 @@
+import argparse
+from pathlib import Path
+from typing import Any
+
+from .exceptions import ScriptError
+from .images import IMAGE_BACKENDS, DEFAULT_IMAGE_DPI, default_job_count
+from .latex import DEFAULT_LATEX_MAX_PASSES
+
+
+def add_build_arguments(parser: argparse.ArgumentParser, project_name: str):
+    """
+    Add the command line options that are shared by the catalog generators.
+
+    :param parser: The argument parser of the generator.
+    :param project_name: The name of the project directory in the help texts, like "project directory".
+    """
+    parser.add_argument('-j', '--jobs',
+                        metavar='N',
+                        type=int,
+                        default=default_job_count(),
+                        help='The maximum number of concurrent workers. '
+                             'Defaults to the number of cores available.')
+    parser.add_argument('--cache-dir',
+                        metavar='<cache directory>',
+                        action='store',
+                        help='Directory for cached results that are kept between runs. '
+                             f'Defaults to `.catalog-cache` in the {project_name}.')
+    parser.add_argument('--image-backend',
+                        choices=IMAGE_BACKENDS,
+                        default='convert',
+                        help='The backend used to convert the images. `convert` runs ImageMagick for each '
+                             'image, `convert-batch` runs ImageMagick for chunks of images, `pillow` '
+                             'converts the images in-process and requires Pillow.')
+    parser.add_argument('--image-batch-size',
+                        metavar='N',
+                        type=int,
+                        default=32,
+                        help='The maximum number of images per ImageMagick process for the '
+                             '`convert-batch` backend.')
+    parser.add_argument('--image-dpi',
+                        metavar='DPI',
+                        type=int,
+                        default=DEFAULT_IMAGE_DPI,
+                        help='The resolution of the embedded images. The size of each image is derived from '
+                             f'the place where it is used in the document. Defaults to {DEFAULT_IMAGE_DPI}.')
+    parser.add_argument('--vectorize-derived',
+                        action='store_true',
+                        help='Evaluate each derived parameter once for all models, using NumPy. '
+                             'Expressions that cannot be vectorized are evaluated for each model.')
+    parser.add_argument('--latex-max-passes',
+                        metavar='N',
+                        type=int,
+                        default=DEFAULT_LATEX_MAX_PASSES,
+                        help='The maximum number of PDFLaTeX runs per document. PDFLaTeX is run until '
+                             f'the cross-references are stable. Defaults to {DEFAULT_LATEX_MAX_PASSES}.')
+    parser.add_argument('--latex-draft-mode',
+                        action='store_true',
+                        help='Run the intermediate PDFLaTeX passes in draft mode, without reading '
+                             'images and writing a PDF.')
+    parser.add_argument('--latex-format',
+                        action='store_true',
+                        help='Precompile the shared LaTeX preamble into a format, which is kept in the '
+                             'cache directory, and compile all documents against it.')
+    parser.add_argument('--no-latex-state',
+                        action='store_true',
+                        help='Do not start the LaTeX builds with the auxiliary files of the previous build.')
+
+
+def apply_build_arguments(working_set: Any, args: argparse.Namespace):
+    """
+    Check the shared command line options and store them in a working set.
+
+    The project directory of the working set must be set, as it is the default for the cache directory.
+
+    :param working_set: The working set of the generator.
+    :param args: The parsed arguments.
+    """
+    if args.cache_dir:
+        working_set.cache_path = Path(args.cache_dir)
+    else:
+        working_set.cache_path = working_set.project_dir / '.catalog-cache'
+    if args.jobs < 1:
+        raise ScriptError('The number of jobs must be at least one.')
+    working_set.jobs = args.jobs
+    working_set.image_backend = args.image_backend
+    if args.image_batch_size < 1:
+        raise ScriptError('The image batch size must be at least one.')
+    working_set.image_batch_size = args.image_batch_size
+    if args.image_dpi < 1:
+        raise ScriptError('The image resolution must be at least one DPI.')
+    working_set.image_dpi = args.image_dpi
+    working_set.vectorize_derived = args.vectorize_derived
+    if args.latex_max_passes < 1:
+        raise ScriptError('The maximum number of PDFLaTeX passes must be at least one.')
+    latex_options = working_set.latex_options
+    latex_options.max_passes = args.latex_max_passes
+    latex_options.draft_mode = args.latex_draft_mode
+    if args.latex_format:
+        latex_options.format_dir = working_set.cache_path / 'latex-formats'
+    if not args.no_latex_state:
+        latex_options.state_dir = working_set.cache_path / 'latex-state'
@@ -0,0 +1,28 @@
+import shutil
+import subprocess
+from pathlib import Path
+
+from .exceptions import ScriptError
+
+
+def extract_pdf_pages(source_path: Path, first_page: int, last_page: int, target_path: Path):
+    """
+    Copy a range of pages from a PDF into a new PDF, using `qpdf`.
+
+    The pages are copied without rendering them again, so this is much faster than compiling
+    the pages a second time.
+
+    :param source_path: The source PDF.
+    :param first_page: The first page to copy, starting with one.
+    :param last_page: The last page to copy, inclusive.
+    :param target_path: The path of the new PDF.
+    """
+    if first_page < 1 or last_page < first_page:
+        raise ScriptError(f'Invalid page range {first_page}-{last_page} for: {target_path}')
+    if shutil.which('qpdf') is None:
+        raise ScriptError('Extracting pages from a PDF requires `qpdf`, which was not found.')
+    args = ['qpdf', '--empty', '--pages', str(source_path), f'{first_page}-{last_page}', '--', str(target_path)]
+    result = subprocess.run(args, capture_output=True)
+    # qpdf returns 3 if it succeeded with warnings.
+    if result.returncode not in (0, 3):
+        raise ScriptError(f'Extracting pages from the PDF failed: {result.stderr}')
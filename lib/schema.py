@@ -0,0 +1,122 @@
+from decimal import Decimal, InvalidOperation
+from typing import Any, Callable, Sequence
+
+from .exceptions import ScriptError
+from .model import CodedColumn
+
+
+# The types a parameter can have, they can be set with `type` in the parameter definitions.
+VALUE_TYPES = ('int', 'float', 'decimal', 'string')
+
+
+def _is_int(value: Any) -> bool:
+    if type(value) is int:
+        return True
+    if not isinstance(value, str) or '.' in value:
+        return False
+    try:
+        int(value)
+    except ValueError:
+        return False
+    return True
+
+
+def _is_float(value: Any) -> bool:
+    if type(value) is float:
+        return True
+    if not isinstance(value, str) or '.' not in value:
+        return False
+    try:
+        float(value)
+    except ValueError:
+        return False
+    return True
+
+
+def _to_int(value: Any) -> int:
+    # `int` alone would truncate floats and accept booleans.
+    if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+        raise ValueError(value)
+    return int(value)
+
+
+def _to_decimal(value: Any) -> Decimal:
+    try:
+        return Decimal(str(value).strip())
+    except InvalidOperation:
+        raise ValueError(value)
+
+
+VALUE_CONVERSIONS: dict[str, Callable[[Any], Any]] = {
+    'int': _to_int,
+    'float': float,
+    'decimal': _to_decimal,
+    'string': str,
+}
+
+
+def _distinct_values(column: Sequence) -> Sequence:
+    # A coded column stores every distinct value once, so only these have to be inspected and converted.
+    return column.distinct if isinstance(column, CodedColumn) else column
+
+
+def infer_value_type(column: Sequence) -> str:
+    """
+    Choose a single type for all values of a parameter.
+
+    Numbers without a decimal point are integers, numbers with a decimal point are floats. If one value of a
+    column is a float, the whole column is float, and if one value is no number, the whole column is text.
+    Decimals are never inferred, they have to be set explicitly.
+
+    :param column: The original values of the parameter.
+    :return: The name of the type, see `VALUE_TYPES`.
+    """
+    value_type = 'int'
+    for value in _distinct_values(column):
+        if value_type == 'int' and _is_int(value):
+            continue
+        if _is_float(value) or _is_int(value):
+            value_type = 'float'
+            continue
+        return 'string'
+    return value_type
+
+
+def convert_values(column: Sequence, value_type: str, name: str) -> list:
+    """
+    Convert all values of a parameter to a single type.
+
+    :param column: The original values of the parameter.
+    :param value_type: The name of the type, see `VALUE_TYPES`.
+    :param name: The name of the parameter, for error messages.
+    :return: The converted values.
+    """
+    conversion = VALUE_CONVERSIONS[value_type]
+    distinct = _distinct_values(column)
+    try:
+        converted = list(map(conversion, distinct))
+    except (ValueError, TypeError):
+        for value in distinct:
+            try:
+                conversion(value)
+            except (ValueError, TypeError):
+                raise ScriptError(f'The value `{value}` of parameter `{name}` is not a valid {value_type}.')
+        raise
+    if distinct is column:
+        return converted
+    return list([converted[code] for code in column.codes])
+
+
+def check_value_type(value_type: str, name: str) -> str:
+    """
+    Check a type set in the parameter file.
+
+    :param value_type: The name of the type.
+    :param name: The name of the parameter, for error messages.
+    :return: The name of the type.
+    """
+    if value_type not in VALUE_TYPES:
+        raise ScriptError(f'Unknown type `{value_type}` for parameter `{name}`. '
+                          f'Use one of: {", ".join(VALUE_TYPES)}')
+    return value_type
+
@@ -0,0 +1,141 @@
+import filecmp
+import hashlib
+import io
+import logging
+import pickle
+import shutil
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+from .exceptions import ScriptError
+
+
+class Stage:
+    """
+    A single step of a build, which reads and writes attributes of a working set.
+    """
+
+    def __init__(self, name: str, function: Callable[[], None], inputs: list[str], outputs: list[str],
+                 cached: bool = True, output_files: Optional[Callable[[], list[Path]]] = None):
+        """
+        Create a new stage.
+
+        :param name: The name of the stage.
+        :param function: The function that executes the stage.
+        :param inputs: The names of the working set attributes the stage reads.
+        :param outputs: The names of the working set attributes the stage writes.
+        :param cached: If the outputs are cached and reused while the inputs do not change. Stages that read
+            from the file system must not be cached, as their inputs are not attributes of the working set.
+        :param output_files: A function that returns the files written by the stage, which are cached with
+            its outputs.
+        """
+        self.name = name
+        self.function = function
+        self.inputs = inputs
+        self.outputs = outputs
+        self.cached = cached
+        self.output_files = output_files
+
+
+class StageRunner:
+    """
+    Runs the stages of a build and caches their artifacts.
+
+    Each cached stage is keyed by the SHA-256 hash of its pickled input values. If the key matches the key of
+    the last run, the stored outputs and files are restored instead of running the stage. As the inputs of a
+    stage are the outputs of the stages before it, a change only re-runs the stages that depend on it.
+    """
+
+    def __init__(self, working_set: Any, cache_dir: Path, log: logging.Logger, salt: str = '', force: bool = False):
+        """
+        Create a new stage runner.
+
+        :param working_set: The working set with the attributes used by the stages.
+        :param cache_dir: The directory to store the artifacts of the stages.
+        :param log: The logger.
+        :param salt: Additional data for all keys, like a hash of the generator itself.
+        :param force: Run all stages, without reusing stored artifacts. The new artifacts are still stored.
+        """
+        self.working_set = working_set
+        self.cache_dir = cache_dir
+        self.log = log
+        self.salt = salt
+        self.force = force
+
+    def _key(self, stage: Stage) -> str:
+        digest = hashlib.sha256(f'{self.salt}:{stage.name}'.encode('utf-8'))
+        for name in stage.inputs:
+            digest.update(name.encode('utf-8'))
+            buffer = io.BytesIO()
+            pickler = pickle.Pickler(buffer, protocol=pickle.HIGHEST_PROTOCOL)
+            # Without the memo, the data does not depend on which equal objects are shared, so restored
+            # outputs get the same key as freshly computed ones.
+            pickler.fast = True
+            pickler.dump(getattr(self.working_set, name))
+            digest.update(buffer.getbuffer())
+        return digest.hexdigest()
+
+    def _artifact_path(self, stage: Stage) -> Path:
+        return self.cache_dir / f'{stage.name}.pickle'
+
+    def _load(self, stage: Stage, key: str) -> Optional[dict]:
+        path = self._artifact_path(stage)
+        if not path.is_file():
+            return None
+        try:
+            artifact = pickle.loads(path.read_bytes())
+        except Exception:
+            return None  # A damaged or outdated artifact just re-runs the stage.
+        if not isinstance(artifact, dict) or artifact.get('key') != key:
+            return None
+        return artifact
+
+    def _restore(self, stage: Stage, artifact: dict):
+        for name, value in artifact['outputs'].items():
+            setattr(self.working_set, name, value)
+        for path_str, file_name in artifact['files'].items():
+            path = Path(path_str)
+            cached_path = self.cache_dir / file_name
+            if not path.is_file() or not filecmp.cmp(path, cached_path, shallow=False):
+                path.parent.mkdir(parents=True, exist_ok=True)
+                shutil.copyfile(cached_path, path)
+
+    def _save(self, stage: Stage, key: str):
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        files: dict[str, str] = {}
+        for index, file_path in enumerate(stage.output_files() if stage.output_files else []):
+            # The files are copied next to the artifact, so they are never read into memory as a whole.
+            file_name = f'{stage.name}-{index}{file_path.suffix}'
+            shutil.copyfile(file_path, self.cache_dir / file_name)
+            files[str(file_path)] = file_name
+        artifact = {
+            'key': key,
+            'outputs': dict((name, getattr(self.working_set, name)) for name in stage.outputs),
+            'files': files,
+        }
+        path = self._artifact_path(stage)
+        tmp_path = path.with_name(f'{path.name}.tmp')
+        tmp_path.write_bytes(pickle.dumps(artifact, protocol=pickle.HIGHEST_PROTOCOL))
+        tmp_path.replace(path)
+
+    def run(self, stages: list[Stage]):
+        """
+        Run all stages in the given order.
+
+        :param stages: The stages. Every input of a stage must be an attribute of the working set.
+        """
+        for stage in stages:
+            missing = [name for name in stage.inputs + stage.outputs if not hasattr(self.working_set, name)]
+            if missing:
+                raise ScriptError(f'Stage "{stage.name}" uses unknown attributes: {", ".join(missing)}')
+            if not stage.cached:
+                stage.function()
+                continue
+            key = self._key(stage)
+            artifact = None if self.force else self._load(stage, key)
+            if artifact:
+                self.log.info(f'Stage "{stage.name}" is up to date, reusing its results.')
+                self._restore(stage, artifact)
+                continue
+            stage.function()
+            self._save(stage, key)
@@ -11,10 +11,9 @@ from dataclasses import dataclass
 from pathlib import Path
 from typing import Optional, Any, Union
 
-from jinja2 import Environment, FileSystemLoader
-
 from lib.model import Model
 from lib.exceptions import ScriptError
+from lib.latex import template_environment
 
 
 @dataclass
@@ -24,6 +23,7 @@ class Parameter:
     unit: str
     for_tables: bool
     for_detail: bool
+    value_type: str = ''  # Optional type of the values, passed to the catalog generator.
 
 
 @dataclass
@@ -165,6 +165,13 @@ class SubProject:
                 parameter['split_model'] = 'Yes'
         return parameter
 
+    @staticmethod
+    def parameter_json(parameter: Parameter) -> dict:
+        data = {'name': parameter.name, 'title': parameter.title, 'unit': parameter.unit}
+        if parameter.value_type:
+            data['type'] = parameter.value_type
+        return data
+
     def write_parameters_json(self):
         """
         Write the collected parameters into the project directory.
@@ -183,17 +190,14 @@ class SubProject:
         data = {
             'title': self.title,
             'component_name': f'{self.project.product}-{self.name}',
-            'parameter': list([{'name': p.name, 'title': p.title, 'unit': p.unit} for p in self.parameter]),
+            'parameter': list([self.parameter_json(p) for p in self.parameter]),
             'models': list([m.to_json(self.project_dir) for m in self.models])
         }
         text = json.dumps(data, indent=4)
         path.write_text(text, encoding='utf-8')
 
     def write_config_ini(self):
-        env = Environment(
-            loader=FileSystemLoader((Path(__file__).parent / 'templates')),
-            autoescape=False
-        )
+        env = template_environment(Path(__file__).parent / 'templates', for_latex=False)
         context = {'title': self.title}
         parameter_order: list[str] = []
         detail_order: list[str] = []
@@ -290,6 +294,7 @@ class WorkingSet:
                     unit=project_parameter['unit'],
                     for_tables=project_parameter['for_tables'],
                     for_detail=project_parameter['for_detail'],
+                    value_type=project_parameter.get('type', ''),
                 )
                 is_excluded = False
                 if 'excluded' in project_parameter and project_parameter['excluded']: